@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+
+from .plugins.scheduler import BATCH
+
+logger = logging.getLogger(__name__)
+
+# Job database and one JSONL result file per job, shared by every worker process
+BATCH_JOBS_DIR = os.getenv(
+    "BATCH_JOBS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "batch_jobs")
+)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# A job is run by the process holding its lease; a lease not renewed for this long can be taken over
+BATCH_JOB_LEASE_SECONDS = float(os.getenv("BATCH_JOB_LEASE_SECONDS", "60"))
+BATCH_ITEM_TIMEOUT_SECONDS = float(os.getenv("BATCH_ITEM_TIMEOUT_SECONDS", "300"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+# Question asked for every account of an accounts job
+BATCH_ACCOUNT_PROMPT = os.getenv(
+    "BATCH_ACCOUNT_PROMPT",
+    "Prioritize the Next Best Actions for the account {account} and explain the top recommendations.",
+)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class BatchJobStore:
+    """
+    SQLite checkpoint of batch jobs and the state of every item.
+
+    Every worker process opens the same database. A queued or running job is run by
+    the process that owns it: `claim` takes the job atomically while it has no
+    owner or its lease has expired, and status changes only apply to jobs that are
+    still queued or running (and, when `owner` is given, still owned by it).
+    """
+
+    def __init__(self, directory: str = BATCH_JOBS_DIR, lease_seconds: float = BATCH_JOB_LEASE_SECONDS):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "jobs.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, total INTEGER NOT NULL, "
+                "created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT, error TEXT, "
+                "owner TEXT, lease_until REAL);"
+                "CREATE TABLE IF NOT EXISTS items ("
+                "job_id TEXT NOT NULL, idx INTEGER NOT NULL, input TEXT NOT NULL, status TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, idx));"
+            )
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            # Databases created before jobs had owners
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db.commit()
+
+    def results_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.jsonl")
+
+    def create(self, kind: str, inputs: list, owner: str = None) -> str:
+        """Insert a queued job, owned by `owner` from the start when given."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, total, created_at, owner, lease_until) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, len(inputs), _now(), owner, time.time() + self.lease_seconds if owner else None),
+            )
+            self._db.executemany(
+                "INSERT INTO items (job_id, idx, input, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, index, value) for index, value in enumerate(inputs)],
+            )
+            self._db.commit()
+        return job_id
+
+    def _update(self, sql: str, params: tuple) -> bool:
+        with self._lock:
+            changed = self._db.execute(sql, params).rowcount
+            self._db.commit()
+        return changed == 1
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Take the job for `owner` if it is unfinished and nobody else holds a live lease on it."""
+        now = time.time()
+        return self._update(
+            "UPDATE jobs SET owner = ?, lease_until = ? WHERE id = ? AND status IN ('queued', 'running') "
+            "AND (owner IS NULL OR owner = ? OR lease_until < ?)",
+            (owner, now + self.lease_seconds, job_id, owner, now),
+        )
+
+    def renew(self, job_id: str, owner: str) -> bool:
+        """Extend the lease of `owner`; False once the job is finished, cancelled or taken over."""
+        return self._update(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status IN ('queued', 'running')",
+            (time.time() + self.lease_seconds, job_id, owner),
+        )
+
+    def release(self, job_id: str, owner: str):
+        """Give the job up (e.g. at shutdown) so another process can resume it right away."""
+        self._update("UPDATE jobs SET owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?", (job_id, owner))
+
+    def owns(self, job_id: str, owner: str) -> bool:
+        """Whether `owner` should keep running the job."""
+        with self._lock:
+            row = self._db.execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row["status"] == "running" and row["owner"] == owner
+
+    def set_status(self, job_id: str, status: str, error: str = None, owner: str = None) -> bool:
+        """
+        Move a queued or running job to `status`. With `owner`, only while that owner
+        holds it. Returns False if the job had already left those states.
+        """
+        column = "started_at" if status == "running" else "finished_at"
+        sql = f"UPDATE jobs SET status = ?, error = ?, {column} = ? WHERE id = ? AND status IN ('queued', 'running')"
+        params = (status, error, _now(), job_id)
+        if owner is not None:
+            sql += " AND owner = ?"
+            params += (owner,)
+        return self._update(sql, params)
+
+    def finish_item(self, job_id: str, index: int, status: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE items SET status = ? WHERE job_id = ? AND idx = ?", (status, job_id, index)
+            )
+            self._db.commit()
+
+    def pending_items(self, job_id: str) -> list:
+        """Items not finished yet, reconciled with the result file in case the last checkpoint was lost."""
+        written = {}
+        path = self.results_path(job_id)
+        if os.path.exists(path):
+            with open(path, "r+b") as f:
+                complete = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # A line cut short by a crash: drop it, that item runs again
+                        break
+                    complete += len(line)
+                    record = json.loads(line)
+                    written[record["index"]] = "failed" if record.get("error") else "done"
+                f.truncate(complete)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, input FROM items WHERE job_id = ? AND status = 'pending' ORDER BY idx", (job_id,)
+            ).fetchall()
+        for index in [row["idx"] for row in rows if row["idx"] in written]:
+            self.finish_item(job_id, index, written[index])
+        return [(row["idx"], row["input"]) for row in rows if row["idx"] not in written]
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        done, failed = counts.get("done", 0), counts.get("failed", 0)
+        job = {key: value for key, value in dict(job).items() if key not in ("owner", "lease_until")}
+        return {
+            **job,
+            "done": done,
+            "failed": failed,
+            "pending": counts.get("pending", 0),
+            "progress": round((done + failed) / job["total"], 4) if job["total"] else 1.0,
+        }
+
+    def list(self, limit: int = 50) -> list:
+        with self._lock:
+            ids = [row["id"] for row in self._db.execute(
+                "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()]
+        return [self.get(job_id) for job_id in ids]
+
+    def unfinished(self) -> list:
+        with self._lock:
+            return [row["id"] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class BatchJobRunner:
+    """
+    Runs batch jobs of chat questions on a bounded pool of `workers`.
+
+    Items are handed to the workers through a queue of twice the pool size, so a
+    large job never has more than that many items in flight. Every result is
+    appended to the job's JSONL file before the item is checkpointed as finished;
+    a job interrupted by a restart resumes with the items that are still pending.
+    Model and search calls run in the BATCH scheduler lane, behind interactive chats.
+
+    With several worker processes each job runs in the one that holds its lease
+    (see BatchJobStore). The lease is renewed while the job runs; jobs whose owner
+    stopped renewing are taken over by another process. Workers check the stored
+    status between items, so a job cancelled from any process stops everywhere.
+
+    Store calls and result writes are blocking file I/O: they run in a thread
+    (`asyncio.to_thread`) so the event loop keeps serving other requests.
+    """
+
+    def __init__(self, get_agent, store: BatchJobStore = None, workers: int = BATCH_WORKERS,
+                 item_timeout: float = BATCH_ITEM_TIMEOUT_SECONDS):
+        # Coroutine function returning the chat agent, which is only loaded once a job runs
+        self.get_agent = get_agent
+        self.store = store or BatchJobStore()
+        self.workers = workers
+        self.item_timeout = item_timeout
+        self.owner = uuid.uuid4().hex
+        self._tasks = {}
+        self._adopter = None
+
+    async def submit(self, kind: str, inputs: list) -> dict:
+        """Create a job for `inputs` (account names for kind "accounts", questions for "queries") and start it."""
+        if kind not in ("accounts", "queries"):
+            raise ValueError(f"Unknown job kind: {kind}")
+        inputs = [value.strip() for value in inputs if value and value.strip()]
+        if not inputs:
+            raise ValueError("A job needs at least one account or query")
+        if len(inputs) > BATCH_MAX_ITEMS:
+            raise ValueError(f"A job can have at most {BATCH_MAX_ITEMS} items")
+        job_id = await asyncio.to_thread(self.store.create, kind, inputs, owner=self.owner)
+        self._start(job_id)
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def _start(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _adopt(self):
+        for job_id in await asyncio.to_thread(self.store.unfinished):
+            if job_id not in self._tasks and await asyncio.to_thread(self.store.claim, job_id, self.owner):
+                logger.info(f"Resuming batch job {job_id}")
+                self._start(job_id)
+
+    async def _adopt_periodically(self):
+        while True:
+            try:
+                await self._adopt()
+            except Exception as e:
+                logger.error(f"Resuming batch jobs failed: {e}")
+            await asyncio.sleep(self.store.lease_seconds)
+
+    def resume(self):
+        """
+        Restart the unfinished jobs no live process holds (left by a previous run),
+        and keep taking over jobs whose owner stops renewing its lease.
+        """
+        if self._adopter is None:
+            self._adopter = asyncio.create_task(self._adopt_periodically())
+
+    async def cancel(self, job_id: str) -> dict:
+        """Cancel a queued or running job; the process running it stops after its current items."""
+        if await asyncio.to_thread(self.store.set_status, job_id, "cancelled"):
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def _question(self, kind: str, value: str) -> str:
+        return BATCH_ACCOUNT_PROMPT.format(account=value) if kind == "accounts" else value
+
+    async def _feed(self, items: list, queue: asyncio.Queue, workers: int):
+        for item in items:
+            await queue.put(item)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _keep_lease(self, job_id: str):
+        while await asyncio.to_thread(self.store.renew, job_id, self.owner):
+            await asyncio.sleep(self.store.lease_seconds / 3)
+
+    async def _set_status(self, job_id: str, status: str, error: str = None) -> bool:
+        return await asyncio.to_thread(self.store.set_status, job_id, status, error, owner=self.owner)
+
+    async def _run(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if not await self._set_status(job_id, "running"):
+            return
+        try:
+            items = await asyncio.to_thread(self.store.pending_items, job_id)
+        except Exception as e:
+            logger.error(f"Batch job {job_id} failed: {e}")
+            await self._set_status(job_id, "failed", str(e))
+            return
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._work(job_id, job["kind"], queue)) for _ in range(self.workers)]
+        # The feeder stops with the workers if they quit early (job cancelled or taken over)
+        helpers = [asyncio.create_task(self._feed(items, queue, len(workers))),
+                   asyncio.create_task(self._keep_lease(job_id))]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            # Cancelled by the API or by shutdown; unfinished items stay pending for a resume
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        except Exception as e:
+            logger.error(f"Batch job {job_id} failed: {e}")
+            for worker in workers:
+                worker.cancel()
+            await self._set_status(job_id, "failed", str(e))
+            return
+        finally:
+            for helper in helpers:
+                helper.cancel()
+        # Only a job this process still runs is completed; a cancel from elsewhere stays as is
+        if await self._set_status(job_id, "completed"):
+            logger.info(f"Batch job {job_id} completed")
+
+    def _checkpoint(self, results, job_id: str, record: dict):
+        results.write(json.dumps(record, default=str) + "\n")
+        results.flush()
+        self.store.finish_item(job_id, record["index"], "failed" if "error" in record else "done")
+
+    async def _work(self, job_id: str, kind: str, queue: asyncio.Queue):
+        agent = await self.get_agent()
+        results = await asyncio.to_thread(open, self.store.results_path(job_id), "a")
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if not await asyncio.to_thread(self.store.owns, job_id, self.owner):
+                    # Cancelled (possibly by another process) or taken over after a lost lease
+                    return
+                index, value = item
+                user = f"batch-{job_id}-{index}"
+                record = {"index": index, "input": value}
+                try:
+                    reply = await asyncio.wait_for(
+                        agent.chat(user, self._question(kind, value), lane=BATCH), self.item_timeout
+                    )
+                    record.update(agent=reply["agent"], answer=reply["answer"], cache=reply["cache"],
+                                  tokens=reply["tokens"]["total"])
+                except asyncio.TimeoutError:
+                    record["error"] = f"Timed out after {self.item_timeout}s"
+                except Exception as e:
+                    record["error"] = str(e)
+                finally:
+                    # Batch questions are independent; do not keep a session per item
+                    agent.sessions.pop(user)
+                record["finished_at"] = _now()
+                await asyncio.to_thread(self._checkpoint, results, job_id, record)
+        finally:
+            await asyncio.to_thread(results.close)
+
+    async def stop(self):
+        """Stop the running jobs without changing their status and release them, so they resume elsewhere."""
+        if self._adopter is not None:
+            self._adopter.cancel()
+        job_ids = list(self._tasks)
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job_id in job_ids:
+            await asyncio.to_thread(self.store.release, job_id, self.owner)
+        await asyncio.to_thread(self.store.close)
@@ -0,0 +1,132 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire `ttl` seconds after they are set.
+
+    A `ttl` of None keeps entries until they are evicted by size. Hit and miss
+    counters are kept so callers can report cache effectiveness.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting the least recently used entries if full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def discard_where(self, match):
+        """Drop every entry whose key satisfies `match(key)`."""
+        with self._lock:
+            for key in [key for key in self._data if match(key)]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlightCache(TTLCache):
+    """
+    TTLCache with async read-through loading.
+
+    Concurrent `get_or_load` calls for the same missing key share one in-flight
+    load instead of each calling the loader; failures are not cached, and neither
+    are loads that were in flight while entries were cleared or discarded.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.coalesced = 0
+        self.generation = 0
+        self._in_flight = {}
+
+    def clear(self):
+        self.generation += 1
+        super().clear()
+
+    def discard_where(self, match):
+        self.generation += 1
+        super().discard_where(match)
+
+    async def get_or_load(self, key, loader):
+        """Return the cached value for `key`, awaiting `loader()` at most once per miss."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leading caller was cancelled, not us: load it ourselves
+                if future.cancelled():
+                    return await self.get_or_load(key, loader)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        generation = self.generation
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unobserved failure is not logged as never-retrieved
+            future.exception()
+            raise
+        else:
+            if self.generation == generation:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
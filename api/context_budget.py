@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tokens one tool result may add to an agent's prompt, unless CONTEXT_AGENT_BUDGETS says otherwise
+CONTEXT_TOOL_OUTPUT_TOKENS = int(os.getenv("CONTEXT_TOOL_OUTPUT_TOKENS", "2000"))
+# Tokens kept of any single document or block within a tool result
+CONTEXT_BLOCK_TOKENS = int(os.getenv("CONTEXT_BLOCK_TOKENS", "400"))
+# Per-agent tool output budgets, e.g. {"PrioritizationAgent": 4000, "MergeAgent": 6000}
+CONTEXT_AGENT_BUDGETS = json.loads(os.getenv("CONTEXT_AGENT_BUDGETS", "{}"))
+# tiktoken encoding used for counting when tiktoken is installed
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        except Exception as e:
+            # Not installed, or the encoding could not be loaded: fall back to an estimate
+            logger.info(f"tiktoken unavailable ({e}); estimating tokens from length")
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text`: exact with tiktoken when installed, else about four characters per token."""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to at most `max_tokens` tokens, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding:
+        text = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        text = text[:max_tokens * 4]
+    return text.rstrip() + " [truncated]"
+
+
+def agent_budget(agent_name: str) -> int:
+    return int(CONTEXT_AGENT_BUDGETS.get(agent_name, CONTEXT_TOOL_OUTPUT_TOKENS))
+
+
+def trim_tool_output(text: str, max_tokens: int, block_tokens: int = CONTEXT_BLOCK_TOKENS) -> str:
+    """
+    Fit tool output into `max_tokens`.
+
+    The output is split into blank-line separated blocks (one per search hit);
+    duplicate blocks are dropped, each block is cut to `block_tokens`, and blocks
+    that no longer fit are replaced by a single note saying how many were left out.
+    """
+    raw_tokens = count_tokens(text)
+    blocks = [block.strip() for block in text.split("\n\n") if block.strip()]
+    seen = set()
+    kept = []
+    used = 0
+    omitted = 0
+    for block in blocks:
+        key = " ".join(block.split()).casefold()
+        if key in seen:
+            continue
+        seen.add(key)
+        # The first block is always kept, cut further if the budget is smaller than a block
+        block = truncate_tokens(block, block_tokens if kept else min(block_tokens, max_tokens))
+        tokens = count_tokens(block)
+        if kept and used + tokens > max_tokens:
+            omitted += 1
+            continue
+        kept.append(block)
+        used += tokens
+    if omitted:
+        kept.append(f"[{omitted} more results omitted to fit the context budget]")
+    trimmed = "\n\n".join(kept)
+    return trimmed if count_tokens(trimmed) < raw_tokens else text
+
+
+def tool_budget_filter(agent_name: str):
+    """
+    Kernel function-invocation filter trimming string tool results to the agent's
+    budget. The token count before and after is kept in the result's metadata.
+    """
+    budget = agent_budget(agent_name)
+
+    async def trim_tool_output_filter(context, next):
+        await next(context)
+        result = context.result
+        if result is None or not isinstance(result.value, str):
+            return
+        raw_tokens = count_tokens(result.value)
+        trimmed = trim_tool_output(result.value, budget)
+        tokens = count_tokens(trimmed) if trimmed is not result.value else raw_tokens
+        context.result = result.model_copy(update={
+            "value": trimmed,
+            "metadata": {**result.metadata, "tokens": tokens, "trimmed_tokens": raw_tokens - tokens},
+        })
+
+    return trim_tool_output_filter
+
+
+class TokenReport:
+    """Token counts of one chat turn, per agent: model usage reported by the service and tool output sizes."""
+
+    FIELDS = ("llm_calls", "prompt_tokens", "cached_tokens", "completion_tokens",
+              "tool_calls", "tool_output_tokens", "tool_output_trimmed_tokens")
+
+    def __init__(self):
+        self.agents = {}
+
+    def _entry(self, agent_name: str) -> dict:
+        return self.agents.setdefault(agent_name or "unknown", dict.fromkeys(self.FIELDS, 0))
+
+    def record_message(self, message, agent_name: str = None):
+        """Add the usage of one model call, taken from the metadata of the message it produced."""
+        usage = (message.metadata or {}).get("usage")
+        if usage is None:
+            return
+        agent_name = agent_name or message.name
+        entry = self._entry(agent_name)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        entry["llm_calls"] += 1
+        entry["prompt_tokens"] += usage.prompt_tokens or 0
+        entry["cached_tokens"] += cached
+        entry["completion_tokens"] += usage.completion_tokens or 0
+        logger.info(
+            f"{agent_name}: prompt={usage.prompt_tokens} (cached={cached}) completion={usage.completion_tokens}"
+        )
+
+    def record_tool(self, agent_name: str, result):
+        entry = self._entry(agent_name)
+        entry["tool_calls"] += 1
+        if result is not None:
+            entry["tool_output_tokens"] += result.metadata.get("tokens", 0)
+            entry["tool_output_trimmed_tokens"] += result.metadata.get("trimmed_tokens", 0)
+
+    def tokens(self, agent_name: str = None) -> int:
+        """Prompt plus completion tokens of `agent_name`, or of every agent."""
+        entries = [self.agents.get(agent_name, {})] if agent_name else self.agents.values()
+        return sum(entry.get("prompt_tokens", 0) + entry.get("completion_tokens", 0) for entry in entries)
+
+    def as_dict(self) -> dict:
+        total = {field: sum(entry[field] for entry in self.agents.values()) for field in self.FIELDS}
+        return {"agents": self.agents, "total": total}
@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import queue
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from .metrics import stage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# DB credentials (from .env or hardcoded — update accordingly)
+DB_USER = os.getenv("DB_USER", "voiceadmin")
+DB_PASS = os.getenv("DB_PASS", "Voice@dm!n")
+DB_SERVER = os.getenv("DB_SERVER", "july-hackathon.database.windows.net")
+DB_NAME = os.getenv("DB_NAME", "voice_nba")
+
+# Pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE_SECONDS = float(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# Point this at a SQLite file to run the API against a local stand-in instead of SQL Server
+DB_SQLITE_PATH = os.getenv("DB_SQLITE_PATH")
+TICKETS_TABLE = os.getenv("TICKETS_TABLE", "main.voice_tickets" if DB_SQLITE_PATH else "voice_nba.dbo.voice_tickets")
+# Optional rowversion (SQL Server) / integer version (SQLite) column bumped on every insert or update
+TICKETS_VERSION_COLUMN = os.getenv("TICKETS_VERSION_COLUMN")
+
+# Connection string
+connection_string = (
+    f'DRIVER={{ODBC Driver 18 for SQL Server}};'
+    f'SERVER=tcp:{DB_SERVER},1433;'
+    f'DATABASE={DB_NAME};'
+    f'UID={DB_USER};'
+    f'PWD={DB_PASS};'
+    'Encrypt=yes;'
+    'TrustServerCertificate=no;'
+)
+
+# Tickets table of the SQLite stand-in. row_version plays the part of SQL Server's
+# rowversion (set TICKETS_VERSION_COLUMN=row_version): triggers take it from a
+# database-wide counter on every insert and update.
+SQLITE_TICKETS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS voice_tickets (
+    ticket_number TEXT, creation_date TEXT, current_Status TEXT, assigned_to TEXT,
+    priority TEXT, subject TEXT, any_other_comments TEXT, row_version INTEGER);
+CREATE INDEX IF NOT EXISTS ix_voice_tickets_keyset ON voice_tickets (creation_date, ticket_number);
+CREATE INDEX IF NOT EXISTS ix_voice_tickets_row_version ON voice_tickets (row_version);
+CREATE TABLE IF NOT EXISTS voice_tickets_version (value INTEGER NOT NULL);
+INSERT INTO voice_tickets_version SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM voice_tickets_version);
+CREATE TRIGGER IF NOT EXISTS voice_tickets_versioned_insert AFTER INSERT ON voice_tickets BEGIN
+    UPDATE voice_tickets_version SET value = value + 1;
+    UPDATE voice_tickets SET row_version = (SELECT value FROM voice_tickets_version) WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS voice_tickets_versioned_update AFTER UPDATE OF
+    ticket_number, creation_date, current_Status, assigned_to, priority, subject, any_other_comments
+    ON voice_tickets BEGIN
+    UPDATE voice_tickets_version SET value = value + 1;
+    UPDATE voice_tickets SET row_version = (SELECT value FROM voice_tickets_version) WHERE rowid = NEW.rowid;
+END;
+"""
+
+
+def init_sqlite_tickets(conn, count: int = 0):
+    """Create the stand-in tickets table (if missing) and add `count` sample tickets."""
+    conn.executescript(SQLITE_TICKETS_SCHEMA)
+    start = conn.execute("SELECT COUNT(*) FROM voice_tickets").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO voice_tickets (ticket_number, creation_date, current_Status, assigned_to, priority, "
+        "subject, any_other_comments) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (f"TCK{i:07d}", f"2024-01-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00",
+             ("Open", "In Progress", "Resolved")[i % 3], f"agent{i % 5}@contoso.com",
+             ("Low", "Medium", "High")[i % 3], f"Order {i:06d} held for review", "")
+            for i in range(start, start + count)
+        ],
+    )
+    conn.commit()
+
+
+def default_connect():
+    """Open a new DB connection, either to SQL Server or to the local SQLite stand-in."""
+    if DB_SQLITE_PATH:
+        import sqlite3
+        return sqlite3.connect(DB_SQLITE_PATH, check_same_thread=False)
+
+    import pyodbc
+    return pyodbc.connect(connection_string)
+
+
+class _PooledConnection:
+    """A raw DB connection plus the bookkeeping the pool needs to recycle it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Fixed-size DB connection pool with a bounded executor for blocking DB calls.
+
+    Connections are opened lazily up to `size`, health-checked with `SELECT 1`
+    on checkout and replaced once they are older than `recycle_seconds`.
+    All DB work should go through `run` so it never blocks the event loop.
+
+    Long-running streams (the tickets export) hold a connection for minutes: they
+    take one of `export_slots` (one less than `size`, so short queries always have
+    a connection left) and do their blocking calls on `export_executor`, so they
+    never wait for a thread behind queries that are waiting for a connection.
+    A pool of one connection has no export slots (`export_slots` is None).
+    """
+
+    def __init__(self, connect=default_connect, size: int = DB_POOL_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT, recycle_seconds: float = DB_POOL_RECYCLE_SECONDS):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle_seconds = recycle_seconds
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+        self.export_slots = asyncio.Semaphore(size - 1) if size > 1 else None
+        self.export_executor = (
+            ThreadPoolExecutor(max_workers=size - 1, thread_name_prefix="db-export") if size > 1 else None
+        )
+
+    def _open(self) -> _PooledConnection:
+        return _PooledConnection(self._connect())
+
+    def _discard(self, conn: _PooledConnection):
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn: _PooledConnection) -> bool:
+        if self.recycle_seconds and time.monotonic() - conn.created_at > self.recycle_seconds:
+            return False
+        try:
+            cursor = conn.raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding unhealthy DB connection: {e}")
+            return False
+
+    def acquire(self) -> _PooledConnection:
+        """Check out a healthy connection, opening a new one if the pool has room."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        return self._open()
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for a DB connection after {self.timeout}s")
+                try:
+                    conn = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn: _PooledConnection, broken: bool = False):
+        """Return a connection to the pool, or close it if it is broken or the pool is closed."""
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        try:
+            conn.raw.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a raw DB connection from the pool."""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn.raw
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(connection, *args, **kwargs)` on the DB executor and return its result."""
+        def call():
+            with self.connection() as conn:
+                return fn(conn, *args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        with stage("sql", fn.__name__):
+            return await loop.run_in_executor(self.executor, call)
+
+    def close(self):
+        """Close all idle connections and shut down the executor."""
+        self._closed = True
+        self.executor.shutdown(wait=True)
+        if self.export_executor is not None:
+            self.export_executor.shutdown(wait=True)
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+if __name__ == "__main__":
+    # python -m api.db [count]: create the SQLite stand-in at DB_SQLITE_PATH with `count` sample tickets
+    if not DB_SQLITE_PATH:
+        sys.exit("Set DB_SQLITE_PATH to the SQLite file to create.")
+    import sqlite3
+    with sqlite3.connect(DB_SQLITE_PATH) as conn:
+        init_sqlite_tickets(conn, int(sys.argv[1]) if len(sys.argv) > 1 else 0)
@@ -1,13 +1,105 @@
-import pyodbc
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
 import os
+import json
+import time
+import asyncio
+import logging
+import importlib
+from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 from dotenv import load_dotenv
 
+from .db import ConnectionPool, TICKETS_VERSION_COLUMN
+from . import metrics
+from .tickets import (
+    DEFAULT_PAGE_SIZE,
+    EXPORT_BATCH_SIZE,
+    EXPORT_FORMATS,
+    MAX_PAGE_SIZE,
+    TicketsCache,
+    decode_cursor,
+    etag_matches,
+    fetch_ticket_changes,
+    fetch_tickets_page,
+    parse_fields,
+    stream_tickets,
+)
+
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Ticket Data API")
+# Logging setup
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from .batch_jobs import BatchJobRunner
+from .plugins.clients import close_clients
+from .plugins.email_outbox import close_email_outbox, get_email_outbox, start_email_outbox
+
+# Seconds without events after which /chat/stream sends a keep-alive and checks for a disconnect
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "10"))
+# Load the chat stack and build the agents at startup instead of on the first chat
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+
+# The agent logic (Semantic Kernel and the plugins) is imported on first use,
+# so workers that only serve tickets start fast and stay small
+_agent = None
+_agent_lock = asyncio.Lock()
+
+
+async def get_agent():
+    global _agent
+    async with _agent_lock:
+        if _agent is None:
+            started = time.perf_counter()
+            # Importing the chat stack takes seconds; do it off the event loop
+            sk_agent = await asyncio.to_thread(importlib.import_module, ".sk_agent", __package__)
+            _agent = sk_agent.SemanticKernelAgent()
+            metrics.startup_seconds.set(time.perf_counter() - started, "chat_import")
+    return _agent
+
+
+async def warm_up():
+    """Import the chat stack and build the plugins and agents, so the first chat does not pay for it."""
+    started = time.perf_counter()
+    try:
+        agent = await get_agent()
+        await agent.start()
+    except Exception as e:
+        logger.error(f"Chat warm-up failed: {e}")
+        return
+    metrics.startup_seconds.set(time.perf_counter() - started, "warmup")
+    logger.info(f"Chat warm-up done in {time.perf_counter() - started:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One DB pool per worker, opened at startup and closed at shutdown
+    app.state.db_pool = ConnectionPool()
+    app.state.tickets_cache = TicketsCache()
+    # Batch jobs left unfinished by the previous run pick up where they stopped
+    app.state.batch_jobs = BatchJobRunner(get_agent)
+    app.state.batch_jobs.resume()
+    start_email_outbox()
+    warmup = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+        await app.state.batch_jobs.stop()
+        await close_email_outbox()
+        if _agent is not None:
+            await _agent.stop()
+        await close_clients()
+        app.state.db_pool.close()
+
+
+app = FastAPI(title="Ticket Data API", lifespan=lifespan)
 
 # Enable CORS (for React frontend to call this)
 app.add_middleware(
@@ -18,95 +110,224 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# DB credentials (from .env or hardcoded — update accordingly)
-DB_USER = os.getenv("DB_USER", "voiceadmin")
-DB_PASS = os.getenv("DB_PASS", "Voice@dm!n")
-DB_SERVER = os.getenv("DB_SERVER", "july-hackathon.database.windows.net")
-DB_NAME = os.getenv("DB_NAME", "voice_nba")
-
-# Connection string
-connection_string = (
-    f'DRIVER={{ODBC Driver 18 for SQL Server}};'
-    f'SERVER=tcp:{DB_SERVER},1433;'
-    f'DATABASE={DB_NAME};'
-    f'UID={DB_USER};'
-    f'PWD={DB_PASS};'
-    'Encrypt=yes;'
-    'TrustServerCertificate=no;'
-)
 
 @app.get("/api/tickets")
-def get_tickets():
+async def get_tickets(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        columns = parse_fields(fields)
+        keyset = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache = app.state.tickets_cache
+    key = (limit, cursor, status, priority, assigned_to, ",".join(columns))
+    with metrics.stage("get_tickets") as measurement:
+        measurement["cache_hit"] = True
+        try:
+            if cache.tracks_updates:
+                etag = cache.etag(await cache.change_signal(app.state.db_pool), key)
+                headers = {"ETag": etag, "Cache-Control": "no-cache"}
+                if etag_matches(if_none_match, etag):
+                    return Response(status_code=304, headers=headers)
+
+                cached = cache.results.get(key)
+                if cached is not None and cached[0] == etag:
+                    measurement["bytes"] = len(cached[1])
+                    return Response(content=cached[1], media_type="application/json", headers=headers)
+
+            measurement["cache_hit"] = False
+            page = await app.state.db_pool.run(
+                fetch_tickets_page, columns, limit, keyset,
+                status=status, priority=priority, assigned_to=assigned_to,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
+
+        response = JSONResponse(content=jsonable_encoder(page))
+        measurement["bytes"] = len(response.body)
+        if cache.tracks_updates:
+            cache.results.set(key, (etag, response.body))
+        else:
+            # The change signal would miss updates: tag the page itself
+            etag = cache.page_etag(response.body)
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return response
+
+@app.get("/api/tickets/changes")
+async def get_ticket_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
+    if not TICKETS_VERSION_COLUMN:
+        raise HTTPException(status_code=501, detail="TICKETS_VERSION_COLUMN is not configured.")
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        with pyodbc.connect(connection_string) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT ticket_number, 
-                       creation_date, 
-                       current_Status, 
-                       assigned_to, 
-                       priority, 
-                       subject, 
-                       any_other_comments 
-                FROM voice_nba.dbo.voice_tickets;
-            """)
-            columns = [column[0] for column in cursor.description]
-            tickets = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            return tickets
+        return await app.state.db_pool.run(fetch_ticket_changes, columns, since, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
 
+@app.get("/api/tickets/export")
+async def export_tickets(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=10000),
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if app.state.db_pool.export_slots is None:
+        # The only connection would go to the export and starve the paginated API
+        raise HTTPException(status_code=503, detail="Exports need DB_POOL_SIZE of at least 2.")
+
+    return StreamingResponse(
+        stream_tickets(
+            app.state.db_pool, columns, format, batch_size,
+            status=status, priority=priority, assigned_to=assigned_to,
+        ),
+        media_type=EXPORT_FORMATS[format],
+    )
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/email/outbox")
+async def email_outbox_stats():
+    return get_email_outbox().stats()
+
 
+# Pydantic models
+class ChatRequest(BaseModel):
+    user: str
+    message: str
 
-# import logging
-# from fastapi import FastAPI, HTTPException
-# from pydantic import BaseModel
-# from typing import List, Optional
-# import os
-# from dotenv import load_dotenv
-# load_dotenv()
 
-# # Logging setup
-# logging.basicConfig(level=logging.INFO)
-# logger = logging.getLogger(__name__)
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    try:
+        agent = await get_agent()
+        response = await agent.chat(request.user, request.message)
+        return response
+    except Exception as e:
+        logger.error(f"Chat error: {e}")
+        raise HTTPException(status_code=500, detail=f"Chat error: {e}")
+
 
-# # Import the isolated agent logic
-# from .sk_agent import SemanticKernelAgent
+@app.delete("/chat/cache")
+async def clear_chat_cache():
+    agent = await get_agent()
+    if agent.response_cache is None:
+        raise HTTPException(status_code=404, detail="The chat response cache is disabled.")
+    stats = agent.response_cache.stats()
+    agent.response_cache.clear()
+    return stats
 
 
-# app = FastAPI(title="Multi-Agent Semantic Kernel Chat API")
+@app.delete("/chat/session/{user}")
+async def end_chat_session(user: str):
+    session = _agent.sessions.pop(user) if _agent is not None else None
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No chat session for {user}.")
+    return session.stats()
+
+
+async def sse_events(request: Request, events):
+    """Format chat events as Server-Sent Events, stopping the agents once the client is gone."""
+    try:
+        async for event in events:
+            if event["event"] == "heartbeat":
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+    finally:
+        await events.aclose()
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request, chat_request: ChatRequest):
+    agent = await get_agent()
+    events = agent.chat_stream(chat_request.user, chat_request.message, heartbeat=SSE_HEARTBEAT_SECONDS)
+    return StreamingResponse(
+        sse_events(request, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class BatchJobRequest(BaseModel):
+    accounts: Optional[list[str]] = None
+    queries: Optional[list[str]] = None
+
+
+@app.post("/api/batch/jobs", status_code=202)
+async def create_batch_job(request: BatchJobRequest):
+    if bool(request.accounts) == bool(request.queries):
+        raise HTTPException(status_code=400, detail="Provide either accounts or queries.")
+    kind = "accounts" if request.accounts else "queries"
+    try:
+        return await app.state.batch_jobs.submit(kind, request.accounts or request.queries)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-# # Pydantic models
-# class ChatRequest(BaseModel):
-#     user: str
-#     message: str
+@app.get("/api/batch/jobs")
+async def list_batch_jobs(limit: int = Query(50, ge=1, le=500)):
+    return await asyncio.to_thread(app.state.batch_jobs.store.list, limit)
 
 
+@app.get("/api/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    job = await asyncio.to_thread(app.state.batch_jobs.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No batch job {job_id}.")
+    return job
 
-# agent = SemanticKernelAgent()
 
-# @app.post("/chat")
-# async def chat(request: ChatRequest):
-#     try:
-#         response = await agent.chat(request.user, request.message)
-#         return response
-#     except Exception as e:
-#         logger.error(f"Chat error: {e}")
-#         #raise HTTPException(status_code=500, detail="Chat agent error.")
-#         raise HTTPException(status_code=500, detail=f"Chat error: {e}")
+@app.get("/api/batch/jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str):
+    store = app.state.batch_jobs.store
+    if await asyncio.to_thread(store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"No batch job {job_id}.")
+    path = store.results_path(job_id)
 
+    def lines():
+        # Results written so far; the file keeps growing while the job runs
+        if os.path.exists(path):
+            with open(path) as f:
+                yield from f
 
-# # Health check endpoint
-# @app.get("/health")
-# def health():
-#     return {"status": "ok"}
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-# # Health check endpoint
-# @app.get("/ticket")
-# def ticket():
-#     return {"status": "ok"}
 
+@app.post("/api/batch/jobs/{job_id}/cancel")
+async def cancel_batch_job(job_id: str):
+    job = await app.state.batch_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No batch job {job_id}.")
+    return job
@@ -0,0 +1,189 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Emit an OpenTelemetry span per stage when opentelemetry-api is installed
+OTEL_TRACES_ENABLED = os.getenv("OTEL_TRACES_ENABLED", "false").lower() == "true"
+# With an OTLP endpoint (and opentelemetry-sdk plus the OTLP exporter installed) spans are exported there
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "tyche-api")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Bucketed distribution per label set; buckets are cumulative when rendered, as Prometheus expects."""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: [count per bucket (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    le = f'le="{bound if isinstance(bound, str) else f"{bound:g}"}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:g}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Last value set per label set."""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:.15g}")
+        return lines
+
+
+class MemoryGauge(Gauge):
+    """Resident and peak memory of this worker process, read from /proc when rendered."""
+
+    def render(self) -> list:
+        try:
+            with open("/proc/self/status") as f:
+                status = dict(line.split(":", 1) for line in f if ":" in line)
+            for field, kind in (("VmRSS", "current"), ("VmHWM", "peak")):
+                self.set(int(status[field].split()[0]) * 1024, kind)
+        except (OSError, KeyError, ValueError):
+            pass
+        return super().render()
+
+
+stage_seconds = Histogram("tyche_stage_duration_seconds", "Duration of a request stage.", ("stage", "name"))
+stage_errors = Counter("tyche_stage_errors_total", "Stages that raised an error.", ("stage", "name"))
+stage_tokens = Counter("tyche_stage_tokens_total", "Model tokens used by a stage.", ("stage", "name"))
+stage_bytes = Counter("tyche_stage_bytes_total", "Payload bytes produced or sent by a stage.", ("stage", "name"))
+stage_cache = Counter("tyche_stage_cache_total", "Cache lookups of a stage by result.", ("stage", "name", "result"))
+
+startup_seconds = Gauge("tyche_startup_seconds", "Time taken by a start-up step of this worker.", ("step",))
+process_memory = MemoryGauge("tyche_process_resident_memory_bytes", "Resident memory of this worker.", ("kind",))
+
+REGISTRY = [stage_seconds, stage_errors, stage_tokens, stage_bytes, stage_cache, startup_seconds, process_memory]
+
+_tracer = None
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = False
+        if OTEL_TRACES_ENABLED:
+            try:
+                from opentelemetry import trace
+                if OTEL_EXPORTER_OTLP_ENDPOINT:
+                    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                    from opentelemetry.sdk.resources import Resource
+                    from opentelemetry.sdk.trace import TracerProvider
+                    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+                    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                    trace.set_tracer_provider(provider)
+                _tracer = trace.get_tracer(__name__)
+            except ImportError as e:
+                logger.warning(f"OpenTelemetry tracing unavailable ({e}); only /metrics is recorded")
+    return _tracer
+
+
+@contextmanager
+def stage(name: str, label: str = ""):
+    """
+    Time the block as stage `name` (e.g. "search", with the index as `label`).
+
+    Yields a dict the block may fill with "tokens", "bytes" and "cache_hit"; they
+    are added to the stage's counters and, with tracing on, set on its span.
+    """
+    measurement = {}
+    tracer = _get_tracer()
+    with tracer.start_as_current_span(name, attributes={"label": label}) if tracer else nullcontext() as span:
+        start = time.perf_counter()
+        try:
+            yield measurement
+        except Exception:
+            stage_errors.inc(1, name, label)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, name, label)
+            if "tokens" in measurement:
+                stage_tokens.inc(measurement["tokens"], name, label)
+            if "bytes" in measurement:
+                stage_bytes.inc(measurement["bytes"], name, label)
+            if "cache_hit" in measurement:
+                stage_cache.inc(1, name, label, "hit" if measurement["cache_hit"] else "miss")
+            if span is not None:
+                span.set_attributes(measurement)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
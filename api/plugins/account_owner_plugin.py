@@ -1,16 +1,23 @@
+from typing import Annotated
 from semantic_kernel.functions import kernel_function
-from .base_vector_search_plugin import BaseVectorSearchPlugin
+from .base_vector_search_plugin import BaseVectorSearchPlugin, FIELDS_DESCRIPTION, FILTERS_DESCRIPTION
 
 class AccountOwnerPlugin(BaseVectorSearchPlugin):
     """Plugin to enable Azure AI Search account owner search capabilities."""
 
-    def __init__(self):
-        super().__init__("account-owner")
+    def __init__(self, index_name: str = "account-owner"):
+        super().__init__(index_name)
 
     @kernel_function(
         description="Account owner search Azure AI Search index for relevant information",
         name="account_owner_search",
     )
-    def account_owner_search(self, query: str, k: int = 3) -> str:
+    async def account_owner_search(
+        self,
+        query: str,
+        k: int = 3,
+        filters: Annotated[str, FILTERS_DESCRIPTION] = "",
+        fields: Annotated[str, FIELDS_DESCRIPTION] = "",
+    ) -> str:
         """Account owner search the Azure AI Search index for relevant information."""
-        return self.search_index(query, k)
+        return await self.search_index_from_tool(query, k, filters, fields)
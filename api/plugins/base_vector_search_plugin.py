@@ -1,54 +1,217 @@
 import os
+import re
+import json
 import logging
-import requests
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.models import VectorizableTextQuery
+from azure.search.documents.models import VectorizableTextQuery, VectorizedQuery
+
+from api.cache import SingleFlightCache
+from api.metrics import stage
+from .clients import get_search_client
+from .embedding_cache import EmbeddingCache, normalize_text
+from .embedding_service import get_embedding_service
+from .local_replica import get_replica, on_replicas_refreshed
 
 # Set up logger
 target_logger = logging.getLogger(__name__)
 
 # Environment variables for embeddings
-AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT")
-AZURE_OPENAI_EMBEDDINGS_ENDPOINT = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
-AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
+
+# "server": Azure Search vectorizes the query text itself (one embedding pass, no client call)
+# "client": the plugin embeds the query, caches the vector and sends a VectorizedQuery
+SEARCH_VECTORIZATION_MODE = os.getenv("SEARCH_VECTORIZATION_MODE", "server").lower()
+
+# Upper bound for k so a single tool call cannot pull an unbounded payload
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "50"))
+
+# Parameter descriptions shared by the search kernel functions
+FILTERS_DESCRIPTION = (
+    'Optional JSON object of index field -> value, list of values, or {"ge": x, "lt": y}, '
+    'e.g. {"account_name": "Contoso", "nba_name": ["Improve Order Velocity"]}'
+)
+FIELDS_DESCRIPTION = "Optional comma separated list of index fields to return, e.g. account_name,nba_child"
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_/]*$")
+_RANGE_OPERATORS = ("eq", "ne", "gt", "ge", "lt", "le")
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+# Shared by every plugin instance so repeated queries skip embedding entirely
+embedding_cache = EmbeddingCache()
+# Formatted search results shared by every plugin; identical concurrent lookups share one request
+search_cache = SingleFlightCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+
+def _drop_search_results(index_name: str):
+    """Forget the cached results of `index_name` once a new replica of it is in place."""
+    search_cache.discard_where(lambda key: key[0] == index_name)
+
+
+on_replicas_refreshed(_drop_search_results)
+
+
+def _odata_literal(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def build_odata_filter(filters: dict) -> str:
+    """
+    Translate structured filters into an OData expression for Azure Search.
+
+    Values can be a scalar (equality), a list or a dict of comparison operators
+    such as {"ge": 10, "lt": 20}. Clauses are AND-ed. `search.in` only takes
+    string fields, so lists of numbers or booleans become an `or` of equalities.
+    """
+    clauses = []
+    for field, value in (filters or {}).items():
+        if not _FIELD_NAME.match(field):
+            raise ValueError(f"Invalid filter field: {field}")
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            if value and all(isinstance(item, (bool, int, float)) for item in value):
+                clauses.append("(" + " or ".join(f"{field} eq {_odata_literal(item)}" for item in value) + ")")
+                continue
+            values = [str(item) for item in value]
+            delimiter = next((d for d in ("|", ",", ";", "~") if not any(d in item for item in values)), None)
+            if delimiter is None:
+                raise ValueError(f"Filter values for {field} contain every supported delimiter (| , ; ~)")
+            joined = delimiter.join(values).replace("'", "''")
+            clauses.append(f"search.in({field}, '{joined}', '{delimiter}')")
+        elif isinstance(value, dict):
+            for operator, operand in value.items():
+                if operator not in _RANGE_OPERATORS:
+                    raise ValueError(f"Invalid filter operator for {field}: {operator}")
+                clauses.append(f"{field} {operator} {_odata_literal(operand)}")
+        else:
+            clauses.append(f"{field} eq {_odata_literal(value)}")
+    return " and ".join(clauses) or None
+
+
+def parse_filters(filters: str) -> dict:
+    """Parse the JSON object of filters a kernel function receives from the model."""
+    if not filters:
+        return {}
+    parsed = json.loads(filters) if isinstance(filters, str) else filters
+    if not isinstance(parsed, dict):
+        raise ValueError("filters must be a JSON object of field -> value")
+    return parsed
+
+
+def parse_fields(fields: str) -> list:
+    """Parse a comma separated field projection."""
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    for field in selected:
+        if not _FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field: {field}")
+    return selected or None
+
+
+def format_document(doc: dict, select: list = None) -> str:
+    """Render a search hit compactly: projected fields, else content/text, else non-vector fields."""
+    if select:
+        return "; ".join(f"{field}: {doc.get(field)}" for field in select if doc.get(field) is not None)
+    content = doc.get("content") or doc.get("text")
+    if content:
+        return content
+    return "; ".join(
+        f"{field}: {value}" for field, value in doc.items()
+        if not field.startswith("@search.") and not field.endswith("_vector") and value is not None
+    )
 
 
 class BaseVectorSearchPlugin:
     """Base plugin class for Azure AI Search capabilities."""
 
-    def __init__(self, index_name: str):
-        self.search_client = SearchClient(
-            endpoint=AZURE_SEARCH_ENDPOINT,
-            index_name=index_name,
-            credential=AzureKeyCredential(AZURE_SEARCH_KEY)
-        )
+    # Filters applied to every query unless the caller overrides the same field
+    default_filters = None
 
-    def get_aoai_embedding(self, text: str) -> list:
-        """Get embedding from Azure OpenAI embeddings deployment."""
-        endpoint = AZURE_OPENAI_EMBEDDINGS_ENDPOINT
-        key = AZURE_OPENAI_KEY
-        headers = {"Content-Type": "application/json", "api-key": key}
-        data = {"input": text}
+    def __init__(self, index_name: str, search_endpoint: str = None, search_key: str = None,
+                 vectorization_mode: str = SEARCH_VECTORIZATION_MODE):
+        if vectorization_mode not in ("client", "server"):
+            raise ValueError(f"Unknown vectorization mode: {vectorization_mode}")
+        self.vectorization_mode = vectorization_mode
+        self.index_name = index_name
+        self.search_client = get_search_client(index_name, search_endpoint, search_key)
 
-        response = requests.post(endpoint, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()["data"][0]["embedding"]
+    async def get_aoai_embedding(self, text: str) -> list:
+        """Get embedding from Azure OpenAI embeddings deployment, using the shared cache."""
+        with stage("embedding") as measurement:
+            measurement["bytes"] = len(text.encode("utf-8"))
+            cached = embedding_cache.get(AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT, text)
+            measurement["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
 
-    def search_index(self, query: str, k: int = 3) -> str:
-        """Search the Azure AI Search index for relevant information."""
-        embedding = self.get_aoai_embedding(query)
+            # Concurrent tool calls are micro-batched into one embeddings request
+            embedding = await get_embedding_service().embed(text)
+            embedding_cache.set(AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT, text, embedding)
+            return embedding
 
-        vector_queries = [VectorizableTextQuery(text=query, k_nearest_neighbors=k, fields="text_vector")]
-        results = self.search_client.search(
+    async def build_vector_query(self, query: str, k: int):
+        """Build the k-NN query for the configured vectorization mode."""
+        if self.vectorization_mode == "client":
+            embedding = await self.get_aoai_embedding(query)
+            return VectorizedQuery(vector=embedding, k_nearest_neighbors=k, fields="text_vector")
+        return VectorizableTextQuery(text=query, k_nearest_neighbors=k, fields="text_vector")
+
+    async def search_index(self, query: str, k: int = 3, filters: dict = None, select: list = None) -> str:
+        """
+        Search the Azure AI Search index for relevant information.
+
+        `filters` are merged over `default_filters` and pushed down as an OData
+        filter; `select` limits which fields come back and are shown.
+        """
+        k = max(1, min(int(k), SEARCH_MAX_K))
+        filters = {**(self.default_filters or {}), **(filters or {})}
+        odata_filter = build_odata_filter(filters)
+        cache_key = (self.index_name, normalize_text(query).casefold(), k, odata_filter, tuple(select or ()))
+        with stage("search", self.index_name) as measurement:
+            # Answered from the cache (or a concurrent identical search) unless the loader runs
+            measurement["cache_hit"] = True
+
+            async def load():
+                measurement["cache_hit"] = False
+                return await self._run_search(query, k, filters, odata_filter, select)
+
+            result = await search_cache.get_or_load(cache_key, load)
+            measurement["bytes"] = len(result.encode("utf-8"))
+            return result
+
+    async def _run_search(self, query: str, k: int, filters: dict, odata_filter: str, select: list) -> str:
+        replica = get_replica(self.index_name)
+        if replica is not None:
+            # Local k-NN always needs the query vector, whatever the vectorization mode
+            hits = replica.search(await self.get_aoai_embedding(query), k, filters)
+            contexts = [f"Document: {format_document(doc, select)}" for doc, _ in hits]
+            return "\n\n".join(contexts) if contexts else "No results found"
+
+        vector_queries = [await self.build_vector_query(query, k)]
+        results = await self.search_client.search(
             search_text=None,
             vector_queries=vector_queries,
+            filter=odata_filter,
+            select=select,
             top=k
         )
         contexts = []
-        for doc in results:
-            content = doc.get("content") or doc.get("text") or str(doc)
-            contexts.append(f"Document: {content}")
+        async for doc in results:
+            contexts.append(f"Document: {format_document(doc, select)}")
         return "\n\n".join(contexts) if contexts else "No results found"
+
+    async def search_index_from_tool(self, query: str, k: int = 3, filters: str = "", fields: str = "") -> str:
+        """Entry point for kernel functions: parse the model's filter/field arguments, then search."""
+        try:
+            parsed_filters = parse_filters(filters)
+            select = parse_fields(fields)
+            build_odata_filter(parsed_filters)
+        except ValueError as e:
+            return f"Invalid search arguments: {e}"
+        return await self.search_index(query, k, parsed_filters, select)
@@ -0,0 +1,80 @@
+import os
+import httpx
+
+from .scheduler import ScheduledSearchPolicy, ScheduledTransport
+
+AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
+AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+
+# Process-wide clients, created on first use and shared by every plugin
+_http_client = None
+_search_transport = None
+_search_clients = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Shared keep-alive HTTP/2 client for Azure OpenAI and Logic App calls. Azure
+    OpenAI chat and embeddings requests go through their rate-limit schedulers.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT_SECONDS,
+            transport=ScheduledTransport(httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            )),
+        )
+    return _http_client
+
+
+def _get_search_transport() -> "AioHttpTransport":
+    global _search_transport
+    if _search_transport is None:
+        # Imported here so the tickets API does not load aiohttp and the Search SDK
+        from azure.core.pipeline.transport import AioHttpTransport
+        # The aiohttp session (and its connection pool) is opened lazily on the first request
+        _search_transport = AioHttpTransport()
+    return _search_transport
+
+
+def get_search_client(index_name: str, endpoint: str = None, key: str = None) -> "SearchClient":
+    """Async search client for `index_name`, created once and sharing one connection pool."""
+    endpoint = endpoint or AZURE_SEARCH_ENDPOINT
+    cache_key = (endpoint, index_name)
+    client = _search_clients.get(cache_key)
+    if client is None:
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents.aio import SearchClient
+        client = SearchClient(
+            endpoint=endpoint,
+            index_name=index_name,
+            credential=AzureKeyCredential(key or AZURE_SEARCH_KEY),
+            transport=_get_search_transport(),
+            # Retries are left to the search scheduler, which also adapts concurrency to throttling
+            per_call_policies=[ScheduledSearchPolicy()],
+            retry_total=0,
+        )
+        _search_clients[cache_key] = client
+    return client
+
+
+async def close_clients():
+    """Close the shared clients; call once on application shutdown."""
+    global _http_client, _search_transport
+    # All search clients share one transport, so closing it once is enough
+    _search_clients.clear()
+    if _search_transport is not None:
+        await _search_transport.close()
+        _search_transport = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
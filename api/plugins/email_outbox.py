@@ -0,0 +1,320 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from api.metrics import stage
+from .clients import get_http_client
+from .scheduler import RETRYABLE_STATUS, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_PATH = os.getenv(
+    "EMAIL_OUTBOX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "email_outbox.db"),
+)
+# Emails to the same endpoint queued within this window are sent as one digest; 0 sends each on its own
+EMAIL_DIGEST_SECONDS = float(os.getenv("EMAIL_DIGEST_SECONDS", "0"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "2"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "300"))
+# Sent and failed emails are kept this long; the same request queued again meanwhile is not sent again
+EMAIL_OUTBOX_RETENTION_SECONDS = float(os.getenv("EMAIL_OUTBOX_RETENTION_SECONDS", "604800"))
+# How long a worker process holds the emails it is delivering before another process may take them over
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", "120"))
+# Longest the worker sleeps between looks at the outbox
+EMAIL_POLL_SECONDS = 30
+
+
+def idempotency_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class EmailOutbox:
+    """
+    Durable queue of emails to Logic App endpoints, delivered by a background worker.
+
+    `enqueue` stores the email in SQLite and returns at once. The worker posts due
+    emails over the shared HTTP client with an `Idempotency-Key` header, retries
+    throttled and failed deliveries with jittered exponential backoff (or after the
+    endpoint's Retry-After), and gives up after `max_attempts`. With a digest window,
+    every pending email to an endpoint is sent as one message once the oldest has
+    waited `digest_seconds`. Emails still pending at shutdown are sent on the next start.
+
+    Several worker processes may share the outbox: a worker claims the emails it is
+    about to send with a conditional UPDATE and only delivers the ones it won. The
+    first claim also fixes which emails go out together and under which key
+    (`batch_key`), so a retry sends the same digest with the same `Idempotency-Key`.
+    """
+
+    def __init__(self, path: str = EMAIL_OUTBOX_PATH, digest_seconds: float = EMAIL_DIGEST_SECONDS,
+                 max_attempts: int = EMAIL_MAX_ATTEMPTS, lease_seconds: float = EMAIL_LEASE_SECONDS):
+        self.path = path
+        self.digest_seconds = digest_seconds
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS emails ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT NOT NULL UNIQUE, "
+                "endpoint TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, next_attempt_at REAL NOT NULL, finished_at REAL, last_error TEXT, "
+                "batch_key TEXT, claimed_by TEXT, lease_until REAL)"
+            )
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(emails)")}
+            # Outboxes created before emails were claimed
+            for column, kind in (("batch_key", "TEXT"), ("claimed_by", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE emails ADD COLUMN {column} {kind}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_emails_pending ON emails(status, next_attempt_at)")
+            self._db.commit()
+        self._wakeup = asyncio.Event()
+        self._worker = None
+
+    def enqueue(self, endpoint: str, subject: str, body: str, request_id: str = None) -> bool:
+        """
+        Queue an email; returns False when the same request is already queued or was recently sent.
+
+        `request_id` identifies one request to send (e.g. one tool call): queueing it again
+        does not send a second copy. Without one every call is a new request, so the same
+        email can be sent again on purpose.
+        """
+        now = time.time()
+        request_id = request_id or uuid.uuid4().hex
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO emails (idempotency_key, endpoint, subject, body, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                # An email that failed for good may be queued again
+                "ON CONFLICT (idempotency_key) DO UPDATE SET status = 'pending', attempts = 0, "
+                "created_at = excluded.created_at, next_attempt_at = excluded.next_attempt_at, "
+                "finished_at = NULL, last_error = NULL, batch_key = NULL WHERE status = 'failed'",
+                (idempotency_key(request_id, endpoint, subject, body), endpoint, subject, body,
+                 now, now + self.digest_seconds),
+            )
+            self._db.commit()
+        self.start()
+        self._wakeup.set()
+        return cursor.rowcount == 1
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker; emails not delivered yet stay queued."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        with self._lock:
+            # Deliveries cut short are left to the next start (or another process) right away
+            self._db.execute(
+                "UPDATE emails SET claimed_by = NULL, lease_until = NULL WHERE claimed_by = ?", (self.owner,)
+            )
+            self._db.commit()
+            self._db.close()
+
+    def _due_batches(self, now: float) -> list:
+        """
+        Claim the emails to send now and return them as batches. Retries keep the batch
+        of their first attempt; new emails go one per batch, or one batch per endpoint
+        with a digest window.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM emails WHERE status = 'pending' AND (claimed_by IS NULL OR lease_until < ?) "
+                "ORDER BY id",
+                (now,),
+            ).fetchall()
+        retries = dict.fromkeys(
+            row["batch_key"] for row in rows if row["batch_key"] is not None and row["next_attempt_at"] <= now
+        )
+        fresh = [row for row in rows if row["batch_key"] is None]
+        due = [row for row in fresh if row["next_attempt_at"] <= now]
+        if self.digest_seconds:
+            # A due email takes every other new email to its endpoint along in the digest
+            endpoints = dict.fromkeys(row["endpoint"] for row in due)
+            fresh_batches = [[row for row in fresh if row["endpoint"] == endpoint] for endpoint in endpoints]
+        else:
+            fresh_batches = [[row] for row in due]
+
+        batches = [self._claim_retry(batch_key, now) for batch_key in retries]
+        batches += [self._claim(batch, now) for batch in fresh_batches]
+        return [batch for batch in batches if batch]
+
+    def _claim(self, batch: list, now: float) -> list:
+        """Claim the new emails of `batch` nobody else took meanwhile and give them their batch key."""
+        ids = [row["id"] for row in batch]
+        marks = ", ".join("?" * len(ids))
+        with self._lock:
+            self._db.execute(
+                f"UPDATE emails SET claimed_by = ?, lease_until = ? WHERE id IN ({marks}) AND status = 'pending' "
+                "AND batch_key IS NULL AND (claimed_by IS NULL OR lease_until < ?)",
+                (self.owner, now + self.lease_seconds, *ids, now),
+            )
+            won = self._db.execute(
+                f"SELECT * FROM emails WHERE id IN ({marks}) AND claimed_by = ? AND batch_key IS NULL ORDER BY id",
+                (*ids, self.owner),
+            ).fetchall()
+            if won:
+                ids = [row["id"] for row in won]
+                marks = ", ".join("?" * len(ids))
+                batch_key = idempotency_key(*sorted(row["idempotency_key"] for row in won))
+                self._db.execute(f"UPDATE emails SET batch_key = ? WHERE id IN ({marks})", (batch_key, *ids))
+                won = self._db.execute(f"SELECT * FROM emails WHERE id IN ({marks}) ORDER BY id", ids).fetchall()
+            self._db.commit()
+        return won
+
+    def _claim_retry(self, batch_key: str, now: float) -> list:
+        """Claim every email of an earlier delivery that is due again, or none if someone else has it."""
+        with self._lock:
+            changed = self._db.execute(
+                "UPDATE emails SET claimed_by = ?, lease_until = ? WHERE batch_key = ? AND status = 'pending' "
+                "AND next_attempt_at <= ? AND (claimed_by IS NULL OR lease_until < ?)",
+                (self.owner, now + self.lease_seconds, batch_key, now, now),
+            ).rowcount
+            won = self._db.execute(
+                "SELECT * FROM emails WHERE batch_key = ? AND claimed_by = ? ORDER BY id", (batch_key, self.owner)
+            ).fetchall() if changed else []
+            self._db.commit()
+        return won
+
+    def _next_wakeup(self) -> float:
+        with self._lock:
+            # Emails another process is delivering are looked at again when its lease runs out
+            (next_at,) = self._db.execute(
+                "SELECT MIN(CASE WHEN claimed_by IS NOT NULL AND lease_until > next_attempt_at "
+                "THEN lease_until ELSE next_attempt_at END) FROM emails WHERE status = 'pending'"
+            ).fetchone()
+        if next_at is None:
+            return EMAIL_POLL_SECONDS
+        return min(max(next_at - time.time(), 0), EMAIL_POLL_SECONDS)
+
+    async def _run(self):
+        failures = 0
+        while True:
+            self._wakeup.clear()
+            try:
+                batches = self._due_batches(time.time())
+                if batches:
+                    await asyncio.gather(*(self._deliver(batch) for batch in batches))
+                self._purge()
+                wait = self._next_wakeup()
+                failures = 0
+            except Exception:
+                # e.g. "database is locked" while another process holds the outbox; keep the worker alive
+                failures += 1
+                wait = min(EMAIL_POLL_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** failures)
+                logger.exception(f"Email outbox worker failed, trying again in {wait:g}s")
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _digest(batch: list) -> tuple:
+        if len(batch) == 1:
+            return batch[0]["subject"], batch[0]["body"]
+        subject = f"Digest: {len(batch)} messages"
+        body = "\n\n-----\n\n".join(f"{row['subject']}\n\n{row['body']}" for row in batch)
+        return subject, body
+
+    async def _deliver(self, batch: list):
+        endpoint = batch[0]["endpoint"]
+        subject, body = self._digest(batch)
+        key = batch[0]["batch_key"]
+        retry_after, permanent = None, False
+        try:
+            with stage("email_delivery") as measurement:
+                measurement["bytes"] = len(body.encode("utf-8"))
+                response = await get_http_client().post(
+                    endpoint,
+                    json={"email_subject": subject, "email_body": body},
+                    headers={"Idempotency-Key": key},
+                )
+            if response.is_success:
+                self._finish(batch, "sent")
+                return
+            error = f"HTTP {response.status_code}"
+            retry_after = parse_retry_after(response.headers)
+            permanent = response.status_code not in RETRYABLE_STATUS
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self._retry_later(batch, error, retry_after, permanent)
+
+    def _finish(self, batch: list, status: str, error: str = None):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE emails SET status = ?, attempts = attempts + 1, finished_at = ?, last_error = ?, "
+                "claimed_by = NULL, lease_until = NULL WHERE id = ? AND claimed_by = ?",
+                [(status, time.time(), error, row["id"], self.owner) for row in batch],
+            )
+            self._db.commit()
+
+    def _retry_later(self, batch: list, error: str, retry_after: float = None, permanent: bool = False):
+        attempts = max(row["attempts"] for row in batch) + 1
+        if permanent or attempts >= self.max_attempts:
+            logger.error(f"Giving up on {len(batch)} email(s) to {batch[0]['endpoint']} after {attempts} attempts: {error}")
+            self._finish(batch, "failed", error)
+            return
+        if retry_after is None:
+            retry_after = random.uniform(0, min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** attempts))
+        logger.warning(f"Email delivery failed ({error}), retrying in {retry_after:.1f}s")
+        with self._lock:
+            self._db.executemany(
+                "UPDATE emails SET attempts = ?, next_attempt_at = ?, last_error = ?, "
+                "claimed_by = NULL, lease_until = NULL WHERE id = ? AND claimed_by = ?",
+                [(attempts, time.time() + retry_after, error, row["id"], self.owner) for row in batch],
+            )
+            self._db.commit()
+
+    def _purge(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM emails WHERE status != 'pending' AND finished_at < ?",
+                (time.time() - EMAIL_OUTBOX_RETENTION_SECONDS,),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM emails GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "sent", "failed")}
+
+
+# Process-wide outbox, opened on first use
+_outbox = None
+
+
+def get_email_outbox() -> EmailOutbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = EmailOutbox()
+    return _outbox
+
+
+def start_email_outbox():
+    """Deliver the emails a previous run left queued; does nothing if there is no outbox yet."""
+    if _outbox is not None or os.path.exists(EMAIL_OUTBOX_PATH):
+        get_email_outbox().start()
+
+
+async def close_email_outbox():
+    global _outbox
+    if _outbox is not None:
+        await _outbox.stop()
+        _outbox = None
@@ -1,24 +1,28 @@
 import os
-import requests
 from semantic_kernel.functions import kernel_function
 
+from api.metrics import stage
+from .email_outbox import get_email_outbox
+
 class EmailPlugin:
     """
     Plugin to send an email by calling a Logic App HTTP request trigger.
     The endpoint is read from the EMAIL_ENDPOINT environment variable.
+    Emails go through the outbox, which delivers them in the background.
     """
     def __init__(self):
         self.endpoint = os.getenv("EMAIL_ENDPOINT")
         if not self.endpoint:
             raise ValueError("EMAIL_ENDPOINT environment variable is not set.")
+        self.outbox = get_email_outbox()
 
     @kernel_function(
         description="Send an email using the Logic App HTTP request trigger.",
         name="send_email",
     )
-    def send_email(self, email_subject: str, email_body: str) -> str:
+    async def send_email(self, email_subject: str, email_body: str) -> str:
         """
-        Sends an email by posting to the Logic App endpoint.
+        Queues an email for the Logic App endpoint and returns without waiting for delivery.
         Args:
             email_subject (str): Email subject
             email_body (str): Email body
@@ -27,10 +31,8 @@ class EmailPlugin:
         """
         # Improve readability: replace double newlines with single, ensure paragraphs, and strip excess whitespace
         formatted_body = email_body.strip().replace('\n\n', '\n').replace('\n', '\n\n')
-        payload = {
-            "email_subject": email_subject,
-            "email_body": formatted_body
-        }
-        response = requests.post(self.endpoint, json=payload)
-        response.raise_for_status()
-        return "Email sent successfully" if response.status_code == 200 else f"Failed to send email: {response.status_code}"
+        with stage("send_email") as measurement:
+            measurement["bytes"] = len(formatted_body.encode("utf-8"))
+            # Each call is its own request; delivery retries reuse the key the outbox stored for it
+            self.outbox.enqueue(self.endpoint, email_subject, formatted_body)
+        return "Email queued for delivery"
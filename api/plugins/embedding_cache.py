@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+from array import array
+
+from api.cache import TTLCache
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+# Optional SQLite file that keeps embeddings across restarts
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Bounded in-memory LRU of embeddings keyed by (deployment, normalized text),
+    backed by an optional on-disk SQLite store.
+    """
+
+    def __init__(self, maxsize: int = EMBEDDING_CACHE_SIZE, path: str = EMBEDDING_CACHE_PATH):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _store(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "deployment TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (deployment, text))"
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, deployment: str, text: str):
+        """Return the cached embedding, or None if it has not been computed yet."""
+        key = (deployment, normalize_text(text))
+        vector = self.memory.get(key)
+        if vector is not None or not self.path:
+            return vector
+
+        with self._lock:
+            row = self._store().execute(
+                "SELECT vector FROM embeddings WHERE deployment = ? AND text = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        vector = array("f", row[0]).tolist()
+        self.memory.set(key, vector)
+        return vector
+
+    def set(self, deployment: str, text: str, vector: list):
+        key = (deployment, normalize_text(text))
+        self.memory.set(key, vector)
+        if not self.path:
+            return
+        with self._lock:
+            db = self._store()
+            db.execute(
+                "INSERT OR REPLACE INTO embeddings (deployment, text, vector) VALUES (?, ?, ?)",
+                (*key, array("f", vector).tobytes()),
+            )
+            db.commit()
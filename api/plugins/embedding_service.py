@@ -0,0 +1,106 @@
+import os
+import asyncio
+import logging
+
+from .clients import get_http_client
+
+logger = logging.getLogger(__name__)
+
+AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
+AZURE_OPENAI_EMBEDDINGS_ENDPOINT = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
+
+# Micro-batching of single embedding requests
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+# Bulk embedding (index builds)
+EMBEDDING_BULK_BATCH_SIZE = int(os.getenv("EMBEDDING_BULK_BATCH_SIZE", "256"))
+EMBEDDING_BULK_CONCURRENCY = int(os.getenv("EMBEDDING_BULK_CONCURRENCY", "4"))
+
+
+class EmbeddingService:
+    """
+    Azure OpenAI embeddings with request batching.
+
+    `embed` collects concurrent single-text calls for up to `max_wait_ms` (or
+    until `max_batch_size` texts are waiting) and sends them as one request;
+    `embed_many` splits large inputs into batches sent with bounded concurrency.
+    """
+
+    def __init__(self, endpoint: str = AZURE_OPENAI_EMBEDDINGS_ENDPOINT, key: str = AZURE_OPENAI_KEY,
+                 max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE, max_wait_ms: float = EMBEDDING_MAX_WAIT_MS):
+        self.endpoint = endpoint
+        self.key = key
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests_sent = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def _request(self, texts: list) -> list:
+        """One embeddings call for `texts`; results are returned in input order."""
+        headers = {"Content-Type": "application/json", "api-key": self.key}
+        self.requests_sent += 1
+        response = await get_http_client().post(self.endpoint, headers=headers, json={"input": texts})
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    async def embed(self, text: str) -> list:
+        """Embed one text, sharing a request with other texts queued at the same time."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(texts, await self._request(texts)))
+        except Exception as e:
+            logger.warning(f"Embedding batch of {len(texts)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    async def embed_many(self, texts: list, batch_size: int = EMBEDDING_BULK_BATCH_SIZE,
+                         concurrency: int = EMBEDDING_BULK_CONCURRENCY) -> list:
+        """Embed a large list of texts (e.g. every document of an index) in batched requests."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(chunk):
+            async with semaphore:
+                return await self._request(chunk)
+
+        chunks = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        return [vector for chunk in results for vector in chunk]
+
+
+_embedding_service = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Process-wide embedding service shared by the plugins and index sync."""
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
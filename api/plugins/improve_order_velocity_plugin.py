@@ -1,20 +1,26 @@
+from typing import Annotated
 from semantic_kernel.functions import kernel_function
-from .base_vector_search_plugin import BaseVectorSearchPlugin
+from .base_vector_search_plugin import BaseVectorSearchPlugin, FIELDS_DESCRIPTION, FILTERS_DESCRIPTION
 import os
 
 class ImproveOrderVelocityPlugin(BaseVectorSearchPlugin):
     """Plugin to enable Azure AI Search improve order velocity search capabilities."""
 
-    def __init__(self):
-        IMPROVE_ORDER_VELOCITY_INDEX_NAME = os.getenv("IMPROVE_ORDER_VELOCITY_INDEX_NAME")
-        super().__init__(IMPROVE_ORDER_VELOCITY_INDEX_NAME)
+    def __init__(self, index_name: str = None):
+        super().__init__(index_name or os.getenv("IMPROVE_ORDER_VELOCITY_INDEX_NAME"))
 
     @kernel_function(
         description="Improve order velocity search Azure AI Search index for relevant information",
         name="improve_order_velocity_search",
     )
-    def improve_order_velocity_search(self, query: str, k: int = 3) -> str:
+    async def improve_order_velocity_search(
+        self,
+        query: str,
+        k: int = 3,
+        filters: Annotated[str, FILTERS_DESCRIPTION] = "",
+        fields: Annotated[str, FIELDS_DESCRIPTION] = "",
+    ) -> str:
         """Improve order velocity search the Azure AI Search index for relevant information."""
-        return self.search_index(query, k)
+        return await self.search_index_from_tool(query, k, filters, fields)
 
 
@@ -1,18 +1,25 @@
+from typing import Annotated
 from semantic_kernel.functions import kernel_function
-from .base_vector_search_plugin import BaseVectorSearchPlugin
+from .base_vector_search_plugin import BaseVectorSearchPlugin, FIELDS_DESCRIPTION, FILTERS_DESCRIPTION
 
 class InvoiceAgingPlugin(BaseVectorSearchPlugin):
     """Plugin to enable Azure AI Search invoice aging search capabilities."""
 
-    def __init__(self):
-        super().__init__("invoice-aging-index")
+    def __init__(self, index_name: str = "invoice-aging-index"):
+        super().__init__(index_name)
 
     @kernel_function(
         description="Invoice aging search Azure AI Search index for relevant information",
         name="invoice_aging_search",
     )
-    def invoice_aging_search(self, query: str, k: int = 3) -> str:
+    async def invoice_aging_search(
+        self,
+        query: str,
+        k: int = 3,
+        filters: Annotated[str, FILTERS_DESCRIPTION] = "",
+        fields: Annotated[str, FIELDS_DESCRIPTION] = "",
+    ) -> str:
         """Invoice aging search the Azure AI Search index for relevant information."""
-        return self.search_index(query, k)
+        return await self.search_index_from_tool(query, k, filters, fields)
 
 
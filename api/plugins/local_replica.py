@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Directory holding one sub-directory per replicated index; unset disables local search
+SEARCH_REPLICA_DIR = os.getenv("SEARCH_REPLICA_DIR")
+SEARCH_REPLICA_REFRESH_SECONDS = float(os.getenv("SEARCH_REPLICA_REFRESH_SECONDS", "3600"))
+# Indexes small and stable enough to be served from the local replica
+REPLICATED_INDEXES = ["threshold-index-new", "invoice-aging-index", "account-owner"]
+
+VECTOR_FIELD = "text_vector"
+# Staging directories left behind by a crashed build are removed after this long
+STALE_STAGING_SECONDS = 3600
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock across processes (every worker refreshes the replicas)."""
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _manifest_version(path: str):
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class LocalIndexReplica:
+    """
+    In-process copy of one Azure AI Search index for exact k-NN search.
+
+    Each document's vector is stored L2-normalized in a memory-mapped float32
+    matrix (`vectors.npy`) and the remaining fields in `documents.jsonl`, so a
+    query is one matrix-vector product over the rows that pass the filters.
+
+    Every build is written to its own versioned directory and `<index_name>` is a
+    symlink to the current one, switched atomically.
+    """
+
+    def __init__(self, index_name: str, directory: str = SEARCH_REPLICA_DIR):
+        self.index_name = index_name
+        self.path = os.path.join(directory, index_name)
+        self.vectors = None
+        self.documents = []
+        self.version = None
+        self._columns = {}
+        self._listeners = []
+
+    @property
+    def loaded(self) -> bool:
+        return self.vectors is not None
+
+    def on_refresh(self, callback):
+        """Register `callback(index_name)`, called whenever a refresh changes the replica."""
+        self._listeners.append(callback)
+
+    def load(self) -> bool:
+        """Map the replica files into memory. Returns False if no replica has been built yet."""
+        for _ in range(3):
+            # Read every file from the version the symlink points at now, even if it switches meanwhile
+            path = os.path.realpath(self.path)
+            try:
+                with open(os.path.join(path, "manifest.json")) as f:
+                    manifest = json.load(f)
+                with open(os.path.join(path, "documents.jsonl")) as f:
+                    documents = [json.loads(line) for line in f]
+                vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+                break
+            except FileNotFoundError:
+                if os.path.realpath(self.path) == path:
+                    return False
+                # That version was cleaned up by a newer build; follow the symlink again
+        else:
+            return False
+        self.vectors = vectors
+        self.documents = documents
+        self.version = manifest["version"]
+        self._columns = {}
+        logger.info(f"Loaded local replica of {self.index_name}: {len(documents)} documents")
+        return True
+
+    @staticmethod
+    def build(index_name: str, documents: list, directory: str = SEARCH_REPLICA_DIR,
+              vector_field: str = VECTOR_FIELD, current_version: str = None) -> str:
+        """
+        Write a replica from documents that carry their vectors in `vector_field`.
+
+        Files are written to a unique staging directory, renamed to a versioned
+        directory and published by atomically replacing the `<index_name>` symlink,
+        under a file lock shared by every process. Readers never see a half-written
+        or missing replica. Nothing is written when the content hash equals
+        `current_version` or the version already published. Returns the content
+        version of the replica.
+        """
+        if not documents:
+            raise ValueError(f"No documents to replicate for {index_name}")
+        vectors = np.asarray([doc[vector_field] for doc in documents], dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError(f"Every document of {index_name} needs a {vector_field} vector of the same size")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        metadata = [{field: value for field, value in doc.items() if field != vector_field} for doc in documents]
+
+        digest = hashlib.sha1(vectors.tobytes())
+        lines = [json.dumps(doc, sort_keys=True, default=str) for doc in metadata]
+        for line in lines:
+            digest.update(line.encode())
+        version = digest.hexdigest()
+        if version == current_version:
+            return version
+
+        target = os.path.join(directory, index_name)
+        if version == _manifest_version(target):
+            return version
+        os.makedirs(directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=directory, prefix=f".{index_name}.tmp-")
+        try:
+            matrix = np.lib.format.open_memmap(
+                os.path.join(staging, "vectors.npy"), mode="w+", dtype=np.float32, shape=vectors.shape
+            )
+            matrix[:] = vectors
+            matrix.flush()
+            del matrix
+            with open(os.path.join(staging, "documents.jsonl"), "w") as f:
+                f.write("\n".join(lines) + ("\n" if lines else ""))
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump({"index_name": index_name, "version": version, "count": len(documents),
+                           "dimensions": int(vectors.shape[1])}, f)
+
+            with _file_lock(os.path.join(directory, f".{index_name}.lock")):
+                previous = os.path.realpath(target) if os.path.lexists(target) else None
+                # Another process may have published the same content while this one was writing
+                if _manifest_version(target) != version:
+                    versioned = os.path.join(directory, f".{index_name}.v-{version}")
+                    if not os.path.exists(versioned):
+                        os.rename(staging, versioned)
+                    LocalIndexReplica._publish(target, versioned)
+                LocalIndexReplica._clean_up(directory, index_name, keep={os.path.realpath(target), previous})
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return version
+
+    @staticmethod
+    def _publish(target: str, versioned: str):
+        """Point the `target` symlink at `versioned` in one rename."""
+        if os.path.isdir(target) and not os.path.islink(target):
+            # A replica written before versioned directories: move it aside once
+            os.rename(target, tempfile.mkdtemp(dir=os.path.dirname(target),
+                                               prefix=f".{os.path.basename(target)}.v-legacy-"))
+        link = f"{target}.link-{os.getpid()}"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.basename(versioned), link)
+        os.replace(link, target)
+
+    @staticmethod
+    def _clean_up(directory: str, index_name: str, keep: set):
+        """Remove versions other than the current and previous one (still mapped by readers), and stale staging."""
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(f".{index_name}.v-") and os.path.realpath(path) not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.startswith(f".{index_name}.tmp-"):
+                try:
+                    if time.time() - os.path.getmtime(path) > STALE_STAGING_SECONDS:
+                        shutil.rmtree(path, ignore_errors=True)
+                except OSError:
+                    pass
+
+    async def sync(self, search_client, embed_many=None) -> bool:
+        """
+        Export every document of the index and rebuild the replica if its content changed.
+
+        Documents whose vector field is not retrievable are embedded with
+        `embed_many(texts)` when given, from the text search results show for them
+        (`format_document`); documents without any text are left out. Returns True
+        if the replica was rebuilt (and listeners notified).
+        """
+        from .base_vector_search_plugin import format_document
+
+        results = await search_client.search(search_text="*")
+        documents = [{field: value for field, value in doc.items() if not field.startswith("@search.")}
+                     async for doc in results]
+
+        missing = [doc for doc in documents if not doc.get(VECTOR_FIELD)]
+        if missing:
+            if embed_many is None:
+                raise ValueError(f"{self.index_name}: {VECTOR_FIELD} is not retrievable and no embedder was given")
+            texts = [format_document(doc) for doc in missing]
+            empty = [doc for doc, text in zip(missing, texts) if not text]
+            if empty:
+                # An embedding of "" would match every unrelated query
+                logger.warning(f"{self.index_name}: leaving out {len(empty)} documents without text")
+                documents = [doc for doc in documents if not any(doc is skipped for skipped in empty)]
+            embedded = [(doc, text) for doc, text in zip(missing, texts) if text]
+            if embedded:
+                vectors = await embed_many([text for _, text in embedded])
+                for (doc, _), vector in zip(embedded, vectors):
+                    doc[VECTOR_FIELD] = vector
+
+        directory = os.path.dirname(self.path)
+        version = await asyncio.to_thread(
+            self.build, self.index_name, documents, directory, VECTOR_FIELD, self.version
+        )
+        if version == self.version:
+            return False
+        self.load()
+        for callback in self._listeners:
+            callback(self.index_name)
+        return True
+
+    def _column(self, field: str) -> np.ndarray:
+        column = self._columns.get(field)
+        if column is None:
+            column = np.array([doc.get(field) for doc in self.documents], dtype=object)
+            self._columns[field] = column
+        return column
+
+    def filter_mask(self, filters: dict = None) -> np.ndarray:
+        """Boolean mask of documents matching the structured filters used for OData pushdown."""
+        mask = np.ones(len(self.documents), dtype=bool)
+        for field, value in (filters or {}).items():
+            if value is None:
+                continue
+            column = self._column(field)
+            if isinstance(value, (list, tuple, set)):
+                mask &= np.isin(column, list(value))
+            elif isinstance(value, dict):
+                for operator, operand in value.items():
+                    mask &= np.array([_compare(item, operator, operand) for item in column], dtype=bool)
+            else:
+                mask &= column == value
+        return mask
+
+    def search_many(self, queries: np.ndarray, k: int, filters: dict = None) -> list:
+        """Top-k documents by cosine similarity for each row of `queries`, as (document, score) lists."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        mask = self.filter_mask(filters)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return [[] for _ in queries]
+
+        # Unfiltered queries read the mapped matrix directly instead of copying the selected rows
+        matrix = self.vectors if mask.all() else self.vectors[candidates]
+        scores = queries @ np.asarray(matrix).T
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, indices in zip(scores, top):
+            indices = indices[np.argsort(-row[indices])]
+            results.append([(self.documents[candidates[i]], float(row[i])) for i in indices])
+        return results
+
+    def search(self, vector: list, k: int, filters: dict = None) -> list:
+        return self.search_many(np.asarray([vector]), k, filters)[0]
+
+
+def _compare(item, operator: str, operand) -> bool:
+    if item is None:
+        return False
+    try:
+        return {
+            "eq": item == operand,
+            "ne": item != operand,
+            "gt": item > operand,
+            "ge": item >= operand,
+            "lt": item < operand,
+            "le": item <= operand,
+        }[operator]
+    except TypeError:
+        return False
+
+
+_replicas = {}
+_refresh_listeners = []
+
+
+def on_replicas_refreshed(callback):
+    """Register `callback(index_name)`, called whenever `sync_replicas` changes any replica."""
+    _refresh_listeners.append(callback)
+
+
+def get_replica(index_name: str):
+    """The loaded replica for `index_name`, or None when local search is off or not built yet."""
+    if not SEARCH_REPLICA_DIR or index_name not in REPLICATED_INDEXES:
+        return None
+    replica = _replicas.get(index_name)
+    if replica is None:
+        replica = LocalIndexReplica(index_name)
+        replica.load()
+        _replicas[index_name] = replica
+    return replica if replica.loaded else None
+
+
+async def sync_replicas(index_names: list = REPLICATED_INDEXES, embed_many=None):
+    """
+    Sync the replicas of `index_names` from Azure AI Search. Documents without a
+    retrievable vector are embedded with the shared batching embedding service.
+    """
+    from .clients import get_search_client
+    from .embedding_service import get_embedding_service
+
+    embed_many = embed_many or get_embedding_service().embed_many
+    for index_name in index_names:
+        replica = _replicas.get(index_name)
+        if replica is None:
+            replica = _replicas[index_name] = LocalIndexReplica(index_name)
+        if not replica.loaded:
+            replica.load()
+        changed = await replica.sync(get_search_client(index_name), embed_many)
+        logger.info(f"Replica of {index_name} {'refreshed' if changed else 'unchanged'}")
+        if changed:
+            for callback in _refresh_listeners:
+                callback(index_name)
+
+
+async def refresh_replicas_periodically(interval: float = SEARCH_REPLICA_REFRESH_SECONDS, embed_many=None):
+    """Background task that keeps the replicas current; cancel it on shutdown."""
+    while True:
+        try:
+            await sync_replicas(embed_many=embed_many)
+        except Exception as e:
+            logger.error(f"Replica refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    # python -m api.plugins.local_replica [index ...]
+    logging.basicConfig(level=logging.INFO)
+    if not SEARCH_REPLICA_DIR:
+        sys.exit("Set SEARCH_REPLICA_DIR to the directory the replicas should be written to.")
+
+    async def main():
+        from .clients import close_clients
+        try:
+            await sync_replicas(sys.argv[1:] or REPLICATED_INDEXES)
+        finally:
+            await close_clients()
+
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import numpy as np
+
+# Scope rules from prioritization_logic_doc
+PRIORITIZATION_SCOPE = {
+    "primary_group": "Life Sciences",
+    "company_region": "NA",
+    "recommendation_type": "Absolute",
+    "nba_name": ["Improve Order Velocity", "Improve Invoice Aging"],
+}
+
+# Intra-NBA child importance weights from prioritization_logic_doc
+NBA_CHILD_WEIGHTS = {
+    "% invoices paid on time": 6,
+    "average order cycle time": 5,
+    "dispute %": 4,
+    "% of orders on hold": 3,
+    "% of invoice over 30 days (by $ value)": 2,
+    "average hold duration": 1,
+}
+
+# Fields of the threshold index the engine reads
+THRESHOLD_FIELDS = [
+    "account_name",
+    "primary_group",
+    "company_region",
+    "recommendation_type",
+    "nba_name",
+    "nba_child",
+    "threshold_value",
+    "nba_child_metrics_value",
+]
+
+OUTPUT_FIELDS = [
+    "rank",
+    "account_name",
+    "nba_name",
+    "nba_child",
+    "threshold_value",
+    "nba_child_metrics_value",
+    "deviation",
+    "importance_weight",
+]
+
+
+def _key(value) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+def _to_float(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace("%", "").replace(",", "").replace("$", "").strip())
+    except ValueError:
+        return np.nan
+
+
+def scope_mask(records: list, scope: dict = PRIORITIZATION_SCOPE) -> np.ndarray:
+    """Boolean mask of the records that satisfy every scope rule."""
+    mask = np.ones(len(records), dtype=bool)
+    for field, allowed in scope.items():
+        allowed = {_key(value) for value in (allowed if isinstance(allowed, (list, tuple, set)) else [allowed])}
+        column = np.array([_key(record.get(field)) for record in records], dtype=object)
+        mask &= np.isin(column, list(allowed))
+    return mask
+
+
+def rank_nba_recommendations(records: list, scope: dict = PRIORITIZATION_SCOPE) -> list:
+    """
+    Rank NBA recommendations with the rules of prioritization_logic_doc in one batched pass.
+
+    Rows are scoped, deduplicated per account_name + nba_name + nba_child (keeping the
+    highest deviation) and weighted. Accounts are ranked by distinct NBA types, distinct
+    NBA children, highest child weight and highest deviation, all descending; rows within
+    an account follow by weight and deviation. Returns one dict per row with OUTPUT_FIELDS.
+    """
+    if not records:
+        return []
+    records = [records[i] for i in np.flatnonzero(scope_mask(records, scope))]
+    if not records:
+        return []
+
+    accounts = np.array([str(record.get("account_name") or "").strip() for record in records], dtype=object)
+    nba_names = np.array([_key(record.get("nba_name")) for record in records], dtype=object)
+    children = np.array([_key(record.get("nba_child")) for record in records], dtype=object)
+    thresholds = np.array([_to_float(record.get("threshold_value")) for record in records])
+    metrics = np.array([_to_float(record.get("nba_child_metrics_value")) for record in records])
+    deviations = metrics - thresholds
+    weights = np.array([NBA_CHILD_WEIGHTS.get(child, 0) for child in children])
+    # Unparseable values sort last instead of poisoning the ordering
+    sortable_deviation = np.where(np.isnan(deviations), -np.inf, deviations)
+
+    # Deduplicate: highest deviation first, then keep the first row of every combination
+    combos = np.array([f"{a}\x1f{_key(n)}\x1f{c}" for a, n, c in zip(accounts, nba_names, children)], dtype=object)
+    order = np.lexsort((-sortable_deviation, combos))
+    _, first = np.unique(combos[order], return_index=True)
+    keep = order[first]
+
+    accounts, nba_names, children = accounts[keep], nba_names[keep], children[keep]
+    deviations, sortable_deviation, weights = deviations[keep], sortable_deviation[keep], weights[keep]
+    kept_records = [records[i] for i in keep]
+
+    # Per-account aggregates
+    account_ids, account_index = np.unique(accounts, return_inverse=True)
+    n_accounts = len(account_ids)
+    type_pairs = np.unique(np.stack([account_index, np.unique(nba_names, return_inverse=True)[1]]), axis=1)
+    n_types = np.bincount(type_pairs[0], minlength=n_accounts)
+    n_children = np.bincount(account_index, minlength=n_accounts)
+    max_weight = np.full(n_accounts, -np.inf)
+    np.maximum.at(max_weight, account_index, weights)
+    max_deviation = np.full(n_accounts, -np.inf)
+    np.maximum.at(max_deviation, account_index, sortable_deviation)
+
+    # np.lexsort sorts by the last key first; names break remaining ties alphabetically
+    account_order = np.lexsort((account_ids, -max_deviation, -max_weight, -n_children, -n_types))
+    account_rank = np.empty(n_accounts, dtype=int)
+    account_rank[account_order] = np.arange(1, n_accounts + 1)
+
+    row_order = np.lexsort((children, -sortable_deviation, -weights, account_rank[account_index]))
+    ranked = []
+    for i in row_order:
+        record = kept_records[i]
+        ranked.append({
+            "rank": int(account_rank[account_index[i]]),
+            "account_name": accounts[i],
+            "nba_name": record.get("nba_name"),
+            "nba_child": record.get("nba_child"),
+            "threshold_value": record.get("threshold_value"),
+            "nba_child_metrics_value": record.get("nba_child_metrics_value"),
+            "deviation": None if np.isnan(deviations[i]) else round(float(deviations[i]), 4),
+            "importance_weight": int(weights[i]),
+        })
+    return ranked
+
+
+def format_ranked_table(rows: list) -> str:
+    """Render ranked rows as a markdown table for the agent to explain."""
+    if not rows:
+        return "No NBA recommendations match the prioritization scope."
+    lines = [
+        "| " + " | ".join(OUTPUT_FIELDS) + " |",
+        "|" + "|".join("---" for _ in OUTPUT_FIELDS) + "|",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join("" if row[field] is None else str(row[field]) for field in OUTPUT_FIELDS) + " |")
+    return "\n".join(lines)
@@ -2,6 +2,10 @@ prioritization_logic_doc = """## Agent Instructions: Prioritization Logic for NB
 
 YOU ARE TO PULL DATA USING THE AVAILABLE PLUGINS
 
+Call PrioritizationPlugin.prioritize_accounts first. It applies every rule below to the full threshold dataset
+and returns the final ranked table; present that table and explain it rather than re-computing the ranking.
+Use ThresholdPlugin.threshold_search only for extra context about a specific account.
+
 ### Purpose
 This agent ranks North American Life Sciences accounts based on the strategic importance of their Next Best Action (NBA) recommendations. It focuses exclusively on the following NBA types:
 
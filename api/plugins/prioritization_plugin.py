@@ -0,0 +1,53 @@
+import os
+from semantic_kernel.functions import kernel_function
+
+from api.cache import TTLCache
+from .base_vector_search_plugin import build_odata_filter
+from .clients import get_search_client
+from .prioritization_engine import (
+    PRIORITIZATION_SCOPE,
+    THRESHOLD_FIELDS,
+    format_ranked_table,
+    rank_nba_recommendations,
+)
+
+THRESHOLD_INDEX_NAME = "threshold-index-new"
+# How long the full threshold dataset is reused before it is read from the index again
+PRIORITIZATION_DATASET_TTL = float(os.getenv("PRIORITIZATION_DATASET_TTL", "600"))
+
+
+class PrioritizationPlugin:
+    """Plugin that ranks NBA recommendations deterministically over the whole threshold index."""
+
+    def __init__(self, index_name: str = THRESHOLD_INDEX_NAME):
+        self.search_client = get_search_client(index_name)
+        self._dataset = TTLCache(maxsize=1, ttl=PRIORITIZATION_DATASET_TTL)
+
+    async def load_threshold_records(self) -> list:
+        """Read every in-scope threshold document (only the fields the engine needs)."""
+        records = self._dataset.get("records")
+        if records is None:
+            results = await self.search_client.search(
+                search_text="*",
+                filter=build_odata_filter(PRIORITIZATION_SCOPE),
+                select=THRESHOLD_FIELDS,
+            )
+            records = [{field: doc.get(field) for field in THRESHOLD_FIELDS} async for doc in results]
+            self._dataset.set("records", records)
+        return records
+
+    @kernel_function(
+        description=(
+            "Rank North American Life Sciences accounts by their Improve Order Velocity and Improve Invoice "
+            "Aging NBA recommendations using the prioritization rules. Returns the final ranked table."
+        ),
+        name="prioritize_accounts",
+    )
+    async def prioritize_accounts(self, account_name: str = "", top_n: int = 10) -> str:
+        """Return the ranked NBA table, optionally for a single account, limited to the top `top_n` accounts."""
+        ranked = rank_nba_recommendations(await self.load_threshold_records())
+        if account_name:
+            ranked = [row for row in ranked if row["account_name"].casefold() == account_name.strip().casefold()]
+        elif top_n:
+            ranked = [row for row in ranked if row["rank"] <= top_n]
+        return format_ranked_table(ranked)
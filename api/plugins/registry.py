@@ -0,0 +1,70 @@
+import os
+import logging
+import importlib
+
+from api.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Plugins by name: the module defining the class of the same name, and the keyword
+# arguments it is built with. Modules are imported on first use only. Arguments read
+# from the environment name their variable in "settings"; while one is unset the
+# plugin is not configured.
+PLUGIN_REGISTRY = {
+    "ThresholdPlugin": {
+        "module": "threshold_plugin",
+        "config": {"index_name": "threshold-index-new"},
+    },
+    "PrioritizationPlugin": {
+        "module": "prioritization_plugin",
+        "config": {"index_name": "threshold-index-new"},
+    },
+    "InvoiceAgingPlugin": {
+        "module": "invoice_aging_plugin",
+        "config": {"index_name": "invoice-aging-index"},
+    },
+    "ImproveOrderVelocityPlugin": {
+        "module": "improve_order_velocity_plugin",
+        "config": {"index_name": os.getenv("IMPROVE_ORDER_VELOCITY_INDEX_NAME")},
+        "settings": {"index_name": "IMPROVE_ORDER_VELOCITY_INDEX_NAME"},
+    },
+    "AccountOwnerPlugin": {
+        "module": "account_owner_plugin",
+        "config": {"index_name": "account-owner"},
+    },
+    "IncreaseCreditLimitPlugin": {
+        "module": "increase_credit_limit_plugin",
+        "config": {"index_name": "increase-credit-limit"},
+    },
+    "EmailPlugin": {
+        "module": "email_plugin",
+        "config": {},
+    },
+}
+
+# One instance per plugin, shared by every kernel that uses it
+_plugins = {}
+
+
+def missing_settings(name: str) -> list:
+    """The settings plugin `name` needs that are not set (empty when it can be built)."""
+    spec = PLUGIN_REGISTRY[name]
+    return [spec.get("settings", {}).get(key, key) for key, value in spec["config"].items() if value is None]
+
+
+def get_plugin(name: str):
+    """The shared instance of plugin `name`, imported and built on first use."""
+    plugin = _plugins.get(name)
+    if plugin is None:
+        spec = PLUGIN_REGISTRY.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown plugin: {name}")
+        with stage("plugin_load", name):
+            module = importlib.import_module(f"{__package__}.{spec['module']}")
+            plugin = _plugins[name] = getattr(module, name)(**spec["config"])
+    return plugin
+
+
+def load_plugins(names) -> dict:
+    """Build the plugins in `names` (e.g. at start-up) and return them by name."""
+    return {name: get_plugin(name) for name in names}
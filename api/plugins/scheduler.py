@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+from azure.core.exceptions import ServiceRequestError
+from azure.core.pipeline.policies import AsyncHTTPPolicy
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from api.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Quotas of the Azure OpenAI deployments and the search service; 0 disables a limit
+CHAT_RPM = float(os.getenv("CHAT_RPM", "0"))
+CHAT_TPM = float(os.getenv("CHAT_TPM", "0"))
+EMBEDDINGS_RPM = float(os.getenv("EMBEDDINGS_RPM", "0"))
+EMBEDDINGS_TPM = float(os.getenv("EMBEDDINGS_TPM", "0"))
+SEARCH_RPM = float(os.getenv("SEARCH_RPM", "0"))
+# Adaptive concurrency per upstream: starts at the maximum, halves on throttling, grows back by one per window
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "16"))
+SCHEDULER_MIN_CONCURRENCY = int(os.getenv("SCHEDULER_MIN_CONCURRENCY", "1"))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_MAX_ATTEMPTS", "5"))
+SCHEDULER_MAX_BACKOFF_SECONDS = float(os.getenv("SCHEDULER_MAX_BACKOFF_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Priority lanes: lower runs first
+INTERACTIVE = 0
+BATCH = 1
+_priority = ContextVar("scheduler_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(lane: int):
+    """Run the calls made inside the block in `lane` (INTERACTIVE or BATCH)."""
+    token = _priority.set(lane)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Throttled(Exception):
+    """A retryable response; `retry_after` is the delay the service asked for, if any."""
+
+    def __init__(self, response, retry_after: float = None):
+        super().__init__("Retryable response" + (f", retry after {retry_after:g}s" if retry_after is not None else ""))
+        self.response = response
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers) -> float:
+    """Delay in seconds from retry-after-ms / x-ms-retry-after-ms / retry-after headers, or None."""
+    for name, scale in (("retry-after-ms", 1000), ("x-ms-retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(float(value) / scale, 0)
+            except ValueError:
+                continue
+    return None
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute's worth; a rate of 0 never waits.
+    Waiters are served lowest lane first, then in arrival order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._waiters = []
+        self._order = itertools.count()
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, amount: float = 1, lane: int = INTERACTIVE):
+        if not self.rate:
+            return
+        # Larger requests than the whole bucket would never fit; let them through on a full bucket
+        amount = min(amount, self.capacity)
+        entry = (lane, next(self._order))
+        async with self._changed:
+            heapq.heappush(self._waiters, entry)
+            # A new first waiter takes over the wait for the refill
+            self._changed.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    first = self._waiters[0] == entry
+                    if first and self.tokens >= amount:
+                        heapq.heappop(self._waiters)
+                        self.tokens -= amount
+                        return
+                    try:
+                        await asyncio.wait_for(self._changed.wait(),
+                                               (amount - self.tokens) / self.rate if first else None)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                if entry in self._waiters:
+                    # Cancelled while waiting
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                self._changed.notify_all()
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit with priority lanes.
+
+    Each success adds 1/limit (about +1 per window of requests), each throttled
+    response halves the limit (at most once a second), and a Retry-After pauses
+    every caller. Waiters are admitted lowest lane first, then in arrival order.
+    """
+
+    def __init__(self, maximum: int = SCHEDULER_MAX_CONCURRENCY, minimum: int = SCHEDULER_MIN_CONCURRENCY):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._order = itertools.count()
+
+    async def acquire(self, lane: int = INTERACTIVE):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (lane, next(self._order), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self.release()
+                raise
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def release(self):
+        self.in_flight -= 1
+        self._admit()
+
+    def _admit(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._admit()
+
+    def on_throttled(self, retry_after: float = None):
+        now = time.monotonic()
+        if now - self._last_decrease >= 1:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_decrease = now
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+
+class RateLimitScheduler:
+    """
+    Client-side scheduler for one upstream (the chat deployment, the embeddings
+    deployment or the search service).
+
+    `run(send, cost)` waits for request/token budget and then for a concurrency
+    slot, both in the caller's priority lane, then sends; the slot is held until
+    the response headers arrive. Budget is taken first, so no slot sits idle
+    while its holder waits for the rate limit. Throttled and transient failures are retried with jittered
+    exponential backoff, or after the service's Retry-After.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0,
+                 max_concurrency: int = SCHEDULER_MAX_CONCURRENCY, min_concurrency: int = SCHEDULER_MIN_CONCURRENCY,
+                 max_attempts: int = SCHEDULER_MAX_ATTEMPTS, max_backoff: float = SCHEDULER_MAX_BACKOFF_SECONDS):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency)
+        self.max_attempts = max_attempts
+        self._backoff = wait_random_exponential(multiplier=0.5, max=max_backoff)
+        self.sent = 0
+        self.throttled = 0
+        self.retries = 0
+
+    def _wait(self, retry_state) -> float:
+        error = retry_state.outcome.exception()
+        if isinstance(error, Throttled) and error.retry_after is not None:
+            # Jitter so callers throttled together do not all come back at the same instant
+            return error.retry_after + random.uniform(0, min(1.0, 0.2 * error.retry_after))
+        return self._backoff(retry_state)
+
+    async def run(self, send, cost: float = 0, status=None, headers=None, discard=None,
+                  transient_errors: tuple = ()):
+        """
+        Send with `send()` and return its response. `status(response)` and
+        `headers(response)` read the outcome; `discard(response)` frees a response
+        that is about to be retried. When every attempt is throttled, the last
+        response is returned as is.
+        """
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            retry=retry_if_exception_type((Throttled, *transient_errors)),
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    return await self._send_once(send, cost, status, headers, discard,
+                                                 attempt.retry_state.attempt_number < self.max_attempts)
+        except Throttled as e:
+            return e.response
+
+    async def _send_once(self, send, cost, status, headers, discard, will_retry: bool):
+        lane = _priority.get()
+        await self.requests.acquire(1, lane)
+        await self.tokens.acquire(cost, lane)
+        await self.concurrency.acquire(lane)
+        try:
+            self.sent += 1
+            response = await send()
+        finally:
+            self.concurrency.release()
+
+        code = status(response)
+        if code == 429:
+            self.throttled += 1
+            retry_after = parse_retry_after(headers(response))
+            self.concurrency.on_throttled(retry_after)
+            if will_retry:
+                await discard(response)
+            raise Throttled(response, retry_after)
+        if code in RETRYABLE_STATUS:
+            if will_retry:
+                await discard(response)
+            raise Throttled(response, parse_retry_after(headers(response)))
+        self.concurrency.on_success()
+        return response
+
+    def _before_sleep(self, retry_state):
+        self.retries += 1
+        logger.warning(f"{self.name}: attempt {retry_state.attempt_number} failed "
+                       f"({retry_state.outcome.exception()}), retrying")
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "waiting": len(self.concurrency._waiters),
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+
+schedulers = {
+    "chat": RateLimitScheduler("chat", rpm=CHAT_RPM, tpm=CHAT_TPM),
+    "embeddings": RateLimitScheduler("embeddings", rpm=EMBEDDINGS_RPM, tpm=EMBEDDINGS_TPM),
+    "search": RateLimitScheduler("search", rpm=SEARCH_RPM),
+}
+
+
+def _estimate_request_tokens(body: bytes) -> int:
+    """Tokens an Azure OpenAI request counts against TPM: its text (about 4 bytes a token) plus max_tokens."""
+    try:
+        payload = json.loads(body)
+        max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or 0
+    except (ValueError, AttributeError):
+        max_tokens = 0
+    return len(body) // 4 + int(max_tokens)
+
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    """httpx transport sending Azure OpenAI chat and embeddings requests through their schedulers."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/chat/completions"):
+            scheduler = schedulers["chat"]
+        elif path.endswith("/embeddings"):
+            scheduler = schedulers["embeddings"]
+        else:
+            return await self.transport.handle_async_request(request)
+        body = await request.aread()
+        # Time until the response headers, queueing and retries included; streamed bodies arrive later
+        with stage("aoai_request", scheduler.name) as measurement:
+            measurement["bytes"] = len(body)
+            return await scheduler.run(
+                lambda: self.transport.handle_async_request(request),
+                cost=_estimate_request_tokens(body),
+                status=lambda response: response.status_code,
+                headers=lambda response: response.headers,
+                discard=lambda response: response.aclose(),
+                transient_errors=(httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError),
+            )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ScheduledSearchPolicy(AsyncHTTPPolicy):
+    """Azure SDK pipeline policy sending search requests through the search scheduler."""
+
+    async def send(self, request):
+        async def discard(response):
+            await response.http_response.load_body()
+
+        return await schedulers["search"].run(
+            lambda: self.next.send(request),
+            status=lambda response: response.http_response.status_code,
+            headers=lambda response: response.http_response.headers,
+            discard=discard,
+            transient_errors=(ServiceRequestError,),
+        )
@@ -1,16 +1,27 @@
+from typing import Annotated
 from semantic_kernel.functions import kernel_function
-from .base_vector_search_plugin import BaseVectorSearchPlugin
+from .base_vector_search_plugin import BaseVectorSearchPlugin, FIELDS_DESCRIPTION, FILTERS_DESCRIPTION
+from .prioritization_engine import PRIORITIZATION_SCOPE
 
 class ThresholdPlugin(BaseVectorSearchPlugin):
     """Plugin to enable Azure AI Search threshold search capabilities."""
 
-    def __init__(self):
-        super().__init__("threshold-index-new")
+    # The prioritization scope rules are applied by the index, not by the model
+    default_filters = PRIORITIZATION_SCOPE
+
+    def __init__(self, index_name: str = "threshold-index-new"):
+        super().__init__(index_name)
 
     @kernel_function(
         description="Threshold search Azure AI Search index for relevant information",
         name="threshold_search",
     )
-    def threshold_search(self, query: str, k: int = 3) -> str:
+    async def threshold_search(
+        self,
+        query: str,
+        k: int = 3,
+        filters: Annotated[str, FILTERS_DESCRIPTION] = "",
+        fields: Annotated[str, FIELDS_DESCRIPTION] = "",
+    ) -> str:
         """Vector search the Azure AI Search index for relevant information."""
-        return self.search_index(query, k)
+        return await self.search_index_from_tool(query, k, filters, fields)
@@ -0,0 +1,116 @@
+import os
+import time
+import logging
+import numpy as np
+from collections import OrderedDict
+
+from .plugins.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "false").lower() == "true"
+# Minimum cosine similarity between two questions for one to reuse the other's answer
+CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", "0.95"))
+# Only replica refreshes clear the cache; changes to indexes searched live are picked up when answers expire
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "120"))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "512"))
+
+
+class SemanticCache:
+    """
+    LRU cache of chat answers looked up by question similarity.
+
+    Questions are embedded with `embed(text)`; a new question reuses the answer
+    of the most similar cached question when their cosine similarity is at least
+    `threshold`. Identical questions (after whitespace normalization) are matched
+    without an embeddings call. Entries expire `ttl` seconds after they are stored.
+    """
+
+    def __init__(self, embed, threshold: float = CHAT_CACHE_SIMILARITY, ttl: float = CHAT_CACHE_TTL,
+                 maxsize: int = CHAT_CACHE_SIZE):
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Bumped by clear(), so answers computed from data that was since refreshed are not stored
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._keys = []
+        self._matrix = None
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [key for key, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similarity_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            vectors = [self._entries[key][0] for key in self._keys]
+            self._matrix = np.stack(vectors) if vectors else None
+        return self._matrix
+
+    async def lookup(self, question: str):
+        """
+        Return `(answer, ticket)`. `answer` is None on a miss; pass `ticket` to
+        `store` together with the freshly computed answer.
+        """
+        key = normalize_text(question).casefold()
+        generation = self.generation
+        self._purge_expired()
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1], None
+
+        try:
+            vector = np.asarray(await self.embed(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Chat cache lookup failed, answering without cache: {e}")
+            self.misses += 1
+            return None, None
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        matrix = self._similarity_matrix()
+        if matrix is not None:
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                match = self._keys[best]
+                self._entries.move_to_end(match)
+                self.hits += 1
+                return self._entries[match][1], None
+
+        self.misses += 1
+        return None, (key, vector, generation)
+
+    def store(self, ticket, answer):
+        """Cache `answer` for the question of a missed `lookup`."""
+        if ticket is None:
+            return
+        key, vector, generation = ticket
+        if generation != self.generation:
+            return
+        self._entries[key] = (vector, answer, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def clear(self, *_):
+        """Drop every entry; also usable directly as an index refresh callback."""
+        self._entries.clear()
+        self._matrix = None
+        self.generation += 1
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._entries)
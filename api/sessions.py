@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from .cache import TTLCache
+from .context_budget import TokenReport, count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Sessions unused for this long are dropped
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+# Estimated tokens of summary plus recent turns kept per session before older turns are summarized
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "3000"))
+SESSION_TOOL_MEMO_SIZE = int(os.getenv("SESSION_TOOL_MEMO_SIZE", "64"))
+SESSION_TOOL_MEMO_TTL = float(os.getenv("SESSION_TOOL_MEMO_TTL", "600"))
+# Plugins with side effects are always called, never answered from the memo
+SESSION_MEMO_EXCLUDED_PLUGINS = {"EmailPlugin"}
+
+
+class ChatSession:
+    """
+    Conversation state of one user: a rolling summary, the recent turns, a memo
+    of tool results that follow-up questions can reuse, and the token report of
+    the current turn.
+    """
+
+    def __init__(self, user: str):
+        self.user = user
+        self.summary = ""
+        self.turns = []
+        self.tool_results = TTLCache(maxsize=SESSION_TOOL_MEMO_SIZE, ttl=SESSION_TOOL_MEMO_TTL)
+        # Per-session copies of the agents whose kernels carry tool_filter
+        self.agents = {}
+        self.report = TokenReport()
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+    @property
+    def has_history(self) -> bool:
+        return bool(self.summary or self.turns)
+
+    def history_tokens(self) -> int:
+        return count_tokens(self.summary) + sum(count_tokens(q) + count_tokens(a) for q, a in self.turns)
+
+    def build_task(self, message: str) -> str:
+        """
+        The task sent to the agents: the conversation so far followed by the new question.
+        The history only grows at its end between summaries, so successive turns of a
+        session share a prompt prefix the service can serve from its prompt cache.
+        """
+        if not self.has_history:
+            return message
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self.turns:
+            parts.append("Recent conversation:\n" + "\n".join(f"User: {q}\nAssistant: {a}" for q, a in self.turns))
+        parts.append(f"Current question:\n{message}")
+        return "\n\n".join(parts)
+
+    def start_turn(self):
+        self.report = TokenReport()
+        self.last_used = time.monotonic()
+
+    def tool_filter(self, agent_name: str):
+        """
+        Kernel filter for the session's copy of `agent_name`: answers repeated tool
+        calls from `tool_results` and records every tool result in `report`.
+        """
+        async def session_tool_filter(context, next):
+            if context.function.plugin_name in SESSION_MEMO_EXCLUDED_PLUGINS:
+                await next(context)
+                self.report.record_tool(agent_name, context.result)
+                return
+            key = (
+                context.function.plugin_name,
+                context.function.name,
+                tuple(sorted((name, str(value)) for name, value in context.arguments.items())),
+            )
+            cached = self.tool_results.get(key)
+            if cached is not None:
+                context.result = cached
+            else:
+                await next(context)
+                if context.result is not None:
+                    self.tool_results.set(key, context.result)
+            self.report.record_tool(agent_name, context.result)
+
+        return session_tool_filter
+
+    def stats(self) -> dict:
+        return {
+            "turns": len(self.turns),
+            "summarized": bool(self.summary),
+            "history_tokens": self.history_tokens(),
+            "tool_results": self.tool_results.stats(),
+        }
+
+
+class SessionStore:
+    """
+    Chat sessions by user, bounded by count (least recently used first) and idle time.
+    Sessions a request is holding the lock of are never evicted.
+
+    When a session's history exceeds `token_budget`, the oldest turns are folded
+    into its summary with `summarize(summary, turns)` until the recent turns fit
+    in half the budget, and the summary is cut to the other half. If summarizing
+    fails the turns are kept for the next try, up to twice the budget.
+    """
+
+    def __init__(self, summarize=None, idle_seconds: float = SESSION_IDLE_SECONDS,
+                 max_sessions: int = SESSION_MAX_COUNT, token_budget: int = SESSION_HISTORY_TOKEN_BUDGET):
+        self.summarize = summarize
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.token_budget = token_budget
+        self._sessions = OrderedDict()
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for user in [user for user, session in self._sessions.items()
+                     if session.last_used < cutoff and not session.lock.locked()]:
+            del self._sessions[user]
+
+    def get(self, user: str) -> ChatSession:
+        """The session of `user`, created on first use."""
+        self.evict_idle()
+        session = self._sessions.get(user)
+        if session is None:
+            session = self._sessions[user] = ChatSession(user)
+            excess = len(self._sessions) - self.max_sessions
+            if excess > 0:
+                # A session in use would lose the turn its request is about to record
+                evictable = [other for other, s in self._sessions.items() if other != user and not s.lock.locked()]
+                for other in evictable[:excess]:
+                    del self._sessions[other]
+        self._sessions.move_to_end(user)
+        session.last_used = time.monotonic()
+        return session
+
+    def pop(self, user: str):
+        return self._sessions.pop(user, None)
+
+    async def record(self, session: ChatSession, question: str, answer: str):
+        """Append a turn and summarize older turns if the history is over budget."""
+        session.turns.append((question, answer))
+        session.last_used = time.monotonic()
+        if session.history_tokens() <= self.token_budget:
+            return
+
+        keep, tokens = 0, 0
+        for q, a in reversed(session.turns):
+            tokens += count_tokens(q) + count_tokens(a)
+            if tokens > self.token_budget // 2:
+                break
+            keep += 1
+        old, recent = session.turns[:len(session.turns) - keep], session.turns[len(session.turns) - keep:]
+
+        summary = session.summary
+        if self.summarize is not None:
+            try:
+                summary = await self.summarize(session.summary, old)
+            except Exception as e:
+                if session.history_tokens() <= self.token_budget * 2:
+                    logger.warning(f"Summarizing the session of {session.user} failed, keeping its turns: {e}")
+                    return
+                logger.warning(f"Summarizing the session of {session.user} failed, dropping old turns: {e}")
+        # The summary is capped as well, so summary and recent turns stay within budget
+        session.summary = truncate_tokens(summary, self.token_budget // 2)
+        session.turns = recent
+
+    def __len__(self):
+        return len(self._sessions)
@@ -1,16 +1,27 @@
 import os
+import time
+import asyncio
 import logging
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from openai import AsyncAzureOpenAI
 from semantic_kernel import Kernel
 from semantic_kernel.agents import Agent, ChatCompletionAgent, SequentialOrchestration
 from semantic_kernel.agents.runtime import InProcessRuntime
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.filters import FilterTypes, FunctionInvocationContext
 
 
 from api.plugins.prioritization_logic_doc import prioritization_logic_doc
-from api.plugins.improve_order_velocity_plugin import ImproveOrderVelocityPlugin
-from .plugins.threshold_plugin import ThresholdPlugin
-from .plugins.account_owner_plugin import AccountOwnerPlugin
-from .plugins.email_plugin import EmailPlugin
+from .plugins.registry import load_plugins, missing_settings
+from .plugins.clients import get_http_client
+from .plugins.scheduler import INTERACTIVE, priority
+from .plugins.embedding_service import get_embedding_service
+from .plugins.local_replica import SEARCH_REPLICA_DIR, on_replicas_refreshed, refresh_replicas_periodically
+from .semantic_cache import CHAT_CACHE_ENABLED, SemanticCache
+from .sessions import ChatSession, SessionStore
+from .context_budget import TokenReport, agent_budget, tool_budget_filter, truncate_tokens
+from .metrics import stage
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -21,36 +32,197 @@ AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
+# Orchestrations hosted by one runtime before it is swapped for a fresh one
+SK_RUNTIME_MAX_ORCHESTRATIONS = int(os.getenv("SK_RUNTIME_MAX_ORCHESTRATIONS", "500"))
+# "sequential": the prioritization agent does everything
+# "concurrent": domain agents gather data in parallel and a merge agent writes the answer
+SK_ORCHESTRATION_MODE = os.getenv("SK_ORCHESTRATION_MODE", "sequential").lower()
+SK_AGENT_TIMEOUT_SECONDS = float(os.getenv("SK_AGENT_TIMEOUT_SECONDS", "60"))
+# Domain agents running at once across every chat of the process
+SK_MAX_CONCURRENT_AGENTS = int(os.getenv("SK_MAX_CONCURRENT_AGENTS", "20"))
+
+# Domain agents of the concurrent mode: (name, plugins, what to gather)
+DOMAIN_AGENTS = [
+    ("ThresholdAgent", ["PrioritizationPlugin", "ThresholdPlugin"], "NBA thresholds and the prioritization ranking"),
+    ("InvoiceAgingAgent", ["InvoiceAgingPlugin"], "invoice aging, past due AR and disputes"),
+    ("OrderVelocityAgent", ["ImproveOrderVelocityPlugin"], "orders, holds, hold codes and release dates"),
+    ("AccountOwnerAgent", ["AccountOwnerPlugin"], "account owners and account-employee relationships"),
+    ("CreditLimitAgent", ["IncreaseCreditLimitPlugin"], "credit limits and credit limit increase guidance"),
+]
+
+# Prompts put what never changes first, so the service's prompt caching can reuse the prefix:
+# the rules shared by every domain agent, then the agent's focus; the conversation and the
+# question only follow in the user message (see ChatSession.build_task)
+DOMAIN_AGENT_INSTRUCTIONS = """You are a data gathering agent for Next Best Action (NBA) analysis.
+Report only SPECIFIC data retrieved from your plugins (names, numbers, dates), citing the plugin for each item.
+Do not make recommendations. If nothing relevant is found, say so in one line.
+Use your plugins to find data about {focus} that is relevant to the request."""
+
+# MergeAgent has no tools, so it gets a short merge-only prompt instead of the prioritization
+# rules: their ranking reaches it through ThresholdAgent's findings
+MERGE_AGENT_INSTRUCTIONS = """You write the final Next Best Action (NBA) answer from the findings of several data gathering agents.
+You have no tools: use only data present in the findings and cite the agent each item came from.
+Order accounts and actions by the prioritization ranking in ThresholdAgent's findings when there is one.
+Make every action item specific (account, order, amount, date). Note any agent that returned no findings."""
+
+SUMMARY_AGENT_INSTRUCTIONS = """You condense a conversation between an analyst and an NBA assistant.
+Merge the existing summary and the new turns into one short summary.
+Keep account names, NBA names, numbers, dates and open questions; drop pleasantries and repeated explanations."""
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-request event sink set by chat_stream, and the agent currently producing events
+_event_sink = ContextVar("event_sink", default=None)
+_current_agent = ContextVar("current_agent", default=None)
+
+
+def emit_event(event: str, **data):
+    """Send a streaming event to the current chat_stream, if there is one."""
+    sink = _event_sink.get()
+    if sink is not None:
+        sink({"event": event, "agent": _current_agent.get(), **data})
+
+
+async def tool_events_filter(context: FunctionInvocationContext, next):
+    """Kernel filter reporting tool calls to a streaming chat as tool_start/tool_end events."""
+    if _event_sink.get() is None:
+        await next(context)
+        return
+    function = f"{context.function.plugin_name}.{context.function.name}"
+    emit_event("tool_start", function=function, arguments={k: str(v) for k, v in context.arguments.items()})
+    started = time.perf_counter()
+    try:
+        await next(context)
+    except Exception as e:
+        emit_event("tool_end", function=function, duration_ms=round((time.perf_counter() - started) * 1000), error=str(e))
+        raise
+    emit_event("tool_end", function=function, duration_ms=round((time.perf_counter() - started) * 1000))
+
+
+@contextmanager
+def agent_stage(agent_name: str, report: TokenReport = None):
+    """Time one agent invocation as an "agent" stage, with the tokens it added to `report`."""
+    tokens = report.tokens(agent_name) if report is not None else 0
+    with stage("agent", agent_name) as measurement:
+        yield measurement
+        if report is not None:
+            measurement["tokens"] = report.tokens(agent_name) - tokens
+
+
+
+
+class SharedRuntime:
+    """
+    One started InProcessRuntime shared by concurrent orchestrations.
+
+    Every orchestration registers its own actors under a unique topic, so runs
+    don't interfere, but those registrations are never removed. After
+    `max_orchestrations` runs the runtime is retired: new runs go to a fresh one
+    and the old one is stopped once its last run has released it.
+    """
+
+    def __init__(self, max_orchestrations: int = SK_RUNTIME_MAX_ORCHESTRATIONS):
+        self.max_orchestrations = max_orchestrations
+        self._runtime = None
+        self._uses = 0
+        self._active = {}
+        self._retired = set()
+
+    async def acquire(self) -> InProcessRuntime:
+        if self._runtime is None or self._uses >= self.max_orchestrations:
+            old = self._runtime
+            self._runtime = InProcessRuntime()
+            # The runtime's message loop runs agents in tasks of its own; start it in an empty
+            # context so it does not inherit the context variables of whichever request started it
+            Context().run(self._runtime.start)
+            self._uses = 0
+            self._active[self._runtime] = 0
+            if old is not None:
+                self._retired.add(old)
+                await self._stop_if_idle(old)
+        self._uses += 1
+        self._active[self._runtime] += 1
+        return self._runtime
+
+    async def _stop_if_idle(self, runtime: InProcessRuntime):
+        if runtime in self._retired and self._active[runtime] == 0:
+            self._retired.discard(runtime)
+            del self._active[runtime]
+            await runtime.stop_when_idle()
+
+    async def release(self, runtime: InProcessRuntime):
+        self._active[runtime] -= 1
+        await self._stop_if_idle(runtime)
+
+    async def stop(self):
+        for runtime in list(self._active):
+            await runtime.stop_when_idle()
+        self._runtime = None
+        self._active.clear()
+        self._retired.clear()
 
-        
 
 class SemanticKernelAgent:
-    
-    def create_agent(self, name: str, instructions: str) -> ChatCompletionAgent:
+    """
+    Multi-agent chat over Semantic Kernel.
+
+    The chat service, plugins, kernels and agents are built once by `start`
+    (called lazily on the first chat) and reused by every request.
+    """
+
+    def __init__(self):
+        self.chat_service = None
+        self.plugins = {}
+        self.agents = None
+        self.runtime = SharedRuntime()
+        self._start_lock = asyncio.Lock()
+        self._replica_refresh = None
+        self.domain_agents = []
+        self.agent_slots = asyncio.Semaphore(SK_MAX_CONCURRENT_AGENTS)
+        self.merge_agent = None
+        self.summary_agent = None
+        self.sessions = SessionStore(summarize=self.summarize)
+        # Answers to earlier questions, dropped whenever the replicated indexes change. Live
+        # Azure Search indexes have no change signal: their updates only show once answers expire
+        self.response_cache = SemanticCache(get_embedding_service().embed) if CHAT_CACHE_ENABLED else None
+        if self.response_cache is not None:
+            on_replicas_refreshed(self.response_cache.clear)
+
+    def create_chat_service(self) -> AzureChatCompletion:
+        # Calls go over the shared HTTP client, whose chat scheduler handles rate limits and retries
+        async_client = AsyncAzureOpenAI(
+            api_key=AZURE_OPENAI_KEY,
+            api_version="2025-01-01-preview",
+            base_url=AZURE_OPENAI_ENDPOINT,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+        return AzureChatCompletion(
+            api_key=AZURE_OPENAI_KEY,
+            deployment_name=AZURE_OPENAI_DEPLOYMENT,
+            api_version="2025-01-01-preview",
+            base_url=AZURE_OPENAI_ENDPOINT,
+            async_client=async_client,
+        )
+
+    def create_agent(self, name: str, instructions: str,
+                     plugin_names: list = ("ThresholdPlugin", "PrioritizationPlugin")) -> ChatCompletionAgent:
         """Create an agent with optional Azure AI Search capabilities."""
         
-        # Create kernel for the agent
+        # Create kernel for the agent; the chat service and plugins are shared across agents
         kernel = Kernel()
-        kernel.add_service(
-            AzureChatCompletion(
-                api_key=AZURE_OPENAI_KEY,
-                deployment_name=AZURE_OPENAI_DEPLOYMENT,
-                api_version="2025-01-01-preview",
-                base_url=AZURE_OPENAI_ENDPOINT
-            )
-        )
+        kernel.add_service(self.chat_service)
         
     
-        threshold_plugin_instance = ThresholdPlugin()
+        for plugin_name in plugin_names:
+            kernel.add_plugin(self.plugins[plugin_name], plugin_name=plugin_name)
+        kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, tool_events_filter)
+        kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, tool_budget_filter(name))
         # account_owner_plugin_instance = AccountOwnerPlugin()
         # improve_order_velocity_plugin_instance = ImproveOrderVelocityPlugin()
         # email_plugin_instance = EmailPlugin()
-        kernel.add_plugin(threshold_plugin_instance, plugin_name="ThresholdPlugin")
         # # kernel.add_plugin(account_owner_plugin_instance, plugin_name="AccountOwnerPlugin")
         # kernel.add_plugin(improve_order_velocity_plugin_instance, plugin_name="ImproveOrderVelocityPlugin")
         # kernel.add_plugin(email_plugin_instance, plugin_name="EmailPlugin")
@@ -59,12 +231,7 @@ class SemanticKernelAgent:
             name=name,
             instructions=instructions,
             kernel=kernel,
-            service=AzureChatCompletion(
-                api_key=AZURE_OPENAI_KEY,
-                deployment_name=AZURE_OPENAI_DEPLOYMENT,
-                api_version="2025-01-01-preview",
-                base_url=AZURE_OPENAI_ENDPOINT
-            ),
+            service=self.chat_service,
         )
 
     def get_agents(self) -> list[Agent]:
@@ -120,26 +287,314 @@ class SemanticKernelAgent:
         #return [data_lookup_agent]
         return [prioritization_agent]
 
-    async def chat(self, user: str, message: str):
-        agents = self.get_agents()
-        sequential_orchestration = SequentialOrchestration(members=agents)
+    async def start(self):
+        """Build the shared chat service, plugins and agents once."""
+        async with self._start_lock:
+            if self.agents is not None:
+                return
+            self.chat_service = self.create_chat_service()
+            plugin_names = {"ThresholdPlugin", "PrioritizationPlugin"}
+            domain_agents = self.configured_domain_agents() if SK_ORCHESTRATION_MODE == "concurrent" else []
+            plugin_names.update(name for _, plugins, _ in domain_agents for name in plugins)
+            # Only the plugins this mode uses are imported and built (see plugins/registry.py)
+            self.plugins = load_plugins(sorted(plugin_names))
+            self.agents = self.get_agents()
+            if SK_ORCHESTRATION_MODE == "concurrent":
+                self.domain_agents = self.get_domain_agents(domain_agents)
+                self.merge_agent = self.create_agent("MergeAgent", MERGE_AGENT_INSTRUCTIONS, plugin_names=[])
+            self.summary_agent = self.create_agent("SummaryAgent", SUMMARY_AGENT_INSTRUCTIONS, plugin_names=[])
+            if SEARCH_REPLICA_DIR:
+                self._replica_refresh = asyncio.create_task(refresh_replicas_periodically())
+            logger.info(f"Agents ready: {[agent.name for agent in self.agents]}")
+
+    async def stop(self):
+        """Stop the shared runtime; the pooled plugin clients are closed by the application."""
+        if self._replica_refresh is not None:
+            self._replica_refresh.cancel()
+            self._replica_refresh = None
+        await self.runtime.stop()
+        self.agents = None
 
-        runtime = InProcessRuntime()
-        runtime.start()
+    @staticmethod
+    def configured_domain_agents() -> list:
+        """The DOMAIN_AGENTS whose plugins are configured; the others are left out with a warning."""
+        configured = []
+        for name, plugin_names, focus in DOMAIN_AGENTS:
+            missing = [setting for plugin_name in plugin_names for setting in missing_settings(plugin_name)]
+            if missing:
+                logger.warning(f"{name} is left out of the concurrent orchestration: set {', '.join(missing)}")
+            else:
+                configured.append((name, plugin_names, focus))
+        return configured
 
-        orchestration_result = await sequential_orchestration.invoke(
-            task=message,
-            runtime=runtime,
+    def get_domain_agents(self, specs: list = DOMAIN_AGENTS) -> list[Agent]:
+        """Return the data gathering agents that run in parallel in the concurrent mode."""
+        return [
+            self.create_agent(name, DOMAIN_AGENT_INSTRUCTIONS.format(focus=focus), plugin_names)
+            for name, plugin_names, focus in specs
+        ]
+
+    def for_session(self, agent: ChatCompletionAgent, session: ChatSession = None) -> ChatCompletionAgent:
+        """
+        The copy of `agent` used by `session`: same instructions and plugins, on a
+        cloned kernel whose filter reuses the session's earlier tool results and
+        records tool output in the session's token report.
+        """
+        if session is None:
+            return agent
+        bound = session.agents.get(agent.name)
+        if bound is None or bound.instructions != agent.instructions:
+            kernel = agent.kernel.clone()
+            session_filter = session.tool_filter(agent.name)
+            # SK runs the filter added last outermost: this one wraps the budget filter, so it
+            # memoizes and records the tool output after it has been trimmed
+            kernel.function_invocation_filters.append((id(session_filter), session_filter))
+            bound = session.agents[agent.name] = agent.model_copy(update={"kernel": kernel})
+        return bound
+
+    async def summarize(self, summary: str, turns: list) -> str:
+        """Fold `turns` into the running `summary` of a session."""
+        conversation = "\n".join(f"User: {q}\nAssistant: {a}" for q, a in turns)
+        if self.summary_agent is None:
+            # Turns answered from the response cache are recorded before the agents are built
+            await self.start()
+        with agent_stage(self.summary_agent.name):
+            response = await self.summary_agent.get_response(
+                messages=f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{conversation}"
+            )
+        return str(response.message.content)
+
+    async def lookup_response(self, session: ChatSession, message: str):
+        """
+        Check the response cache for `message`. Returns (cached reply or None, status
+        for a computed answer, ticket for `store_response`).
+        """
+        if self.response_cache is None:
+            return None, "off", None
+        if session.has_history:
+            # Follow-up questions depend on the conversation, so only opening questions are cached
+            return None, "bypass", None
+        cached, ticket = await self.response_cache.lookup(message)
+        return cached, "miss", ticket
+
+    def store_response(self, status: str, ticket, reply: dict):
+        if status == "miss":
+            self.response_cache.store(ticket, reply)
+
+    @staticmethod
+    async def record_usage(report: TokenReport, response):
+        """Add the model calls of an agent response (tool-call rounds included) to `report`."""
+        if report is None:
+            return
+        async for message in response.thread.get_messages():
+            report.record_message(message)
+
+    async def chat(self, user: str, message: str, lane: int = INTERACTIVE) -> dict:
+        """
+        Answer `message` in the session of `user`. Returns {"agent", "answer", "cache", "tokens"},
+        where cache is "hit" when the answer was reused from a similar earlier question,
+        "miss" when it was computed (and cached), "bypass" for follow-up questions, or
+        "off" when the response cache is disabled, and tokens is the turn's TokenReport.
+
+        `lane` is the scheduler priority of the model and search calls (BATCH for jobs).
+        """
+        session = self.sessions.get(user)
+        with priority(lane), stage("chat", SK_ORCHESTRATION_MODE) as measurement:
+            reply = await self._chat(session, message, lane)
+            if reply["cache"] in ("hit", "miss"):
+                measurement["cache_hit"] = reply["cache"] == "hit"
+            measurement["tokens"] = session.report.tokens()
+            return reply
+
+    async def _chat(self, session: ChatSession, message: str, lane: int) -> dict:
+        async with session.lock:
+            session.start_turn()
+            cached, status, ticket = await self.lookup_response(session, message)
+            if cached is not None:
+                await self.sessions.record(session, message, cached["answer"])
+                return {**cached, "cache": "hit", "tokens": session.report.as_dict()}
+
+            if self.agents is None:
+                await self.start()
+            task = session.build_task(message)
+            if SK_ORCHESTRATION_MODE == "concurrent":
+                result = await self.chat_concurrent(task, session)
+            elif lane != INTERACTIVE:
+                # Agents on the shared runtime run in its tasks, outside the caller's priority lane
+                result = await self.chat_in_order(task, session)
+            else:
+                result = await self.chat_sequential(task, session)
+
+            reply = {"agent": result.name, "answer": str(result.content)}
+            self.store_response(status, ticket, reply)
+            await self.sessions.record(session, message, reply["answer"])
+            return {**reply, "cache": status, "tokens": session.report.as_dict()}
+
+    async def chat_sequential(self, message: str, session: ChatSession = None):
+        """Run the agents one after another on the shared runtime; returns the last agent's message."""
+        sequential_orchestration = SequentialOrchestration(
+            members=[self.for_session(agent, session) for agent in self.agents],
+            agent_response_callback=session.report.record_message if session else None,
         )
 
-        value = await orchestration_result.get()
-        # results = []
-        # for item in value:
-        #     results.append({"agent": item.name, "answer": item.content})
+        runtime = await self.runtime.acquire()
+        try:
+            # The agents run inside the runtime, so the orchestration is timed as a whole
+            with stage("orchestration", "sequential") as measurement:
+                orchestration_result = await sequential_orchestration.invoke(
+                    task=message,
+                    runtime=runtime,
+                )
 
-        await runtime.stop_when_idle()
+                value = await orchestration_result.get()
+                if session is not None:
+                    measurement["tokens"] = session.report.tokens()
+            # results = []
+            # for item in value:
+            #     results.append({"agent": item.name, "answer": item.content})
+        finally:
+            await self.runtime.release(runtime)
         return value
 
+    async def chat_in_order(self, message: str, session: ChatSession = None):
+        """The hand-off of `chat_sequential`, run in the caller's task; returns the last agent's message."""
+        result = None
+        for agent in self.agents:
+            with agent_stage(agent.name, session and session.report):
+                response = await self.for_session(agent, session).get_response(
+                    messages=message if result is None else str(result.content)
+                )
+                await self.record_usage(session and session.report, response)
+            result = response.message
+        return result
+
+    async def gather_findings(self, message: str, session: ChatSession = None) -> list:
+        """
+        Run every domain agent on `message` in parallel; at most SK_MAX_CONCURRENT_AGENTS
+        run at a time across all chats. An agent that fails or exceeds SK_AGENT_TIMEOUT_SECONDS contributes a
+        note instead of failing the chat. Returns (agent name, findings) pairs.
+        """
+        async def run(agent: ChatCompletionAgent):
+            agent = self.for_session(agent, session)
+            async with self.agent_slots:
+                _current_agent.set(agent.name)
+                emit_event("agent_start")
+                try:
+                    with agent_stage(agent.name, session and session.report):
+                        response = await asyncio.wait_for(agent.get_response(messages=message), SK_AGENT_TIMEOUT_SECONDS)
+                        await self.record_usage(session and session.report, response)
+                    findings = str(response.message.content)
+                except asyncio.TimeoutError:
+                    logger.warning(f"{agent.name} timed out after {SK_AGENT_TIMEOUT_SECONDS}s")
+                    findings = f"No findings: timed out after {SK_AGENT_TIMEOUT_SECONDS}s."
+                except Exception as e:
+                    logger.error(f"{agent.name} failed: {e}")
+                    findings = f"No findings: {e}"
+                emit_event("agent_end")
+                return agent.name, findings
+
+        return await asyncio.gather(*(run(agent) for agent in self.domain_agents))
+
+    @staticmethod
+    def build_merge_task(message: str, findings: list) -> str:
+        # The findings share MergeAgent's budget, so one verbose agent cannot crowd out the rest
+        per_agent = agent_budget("MergeAgent") // max(len(findings), 1)
+        sections = "\n\n".join(f"### {name}\n{truncate_tokens(text, per_agent)}" for name, text in findings)
+        return f"Request: {message}\n\nFindings:\n\n{sections}"
+
+    async def chat_concurrent(self, message: str, session: ChatSession = None):
+        """Fan out to the domain agents, then let the merge agent write the final answer."""
+        findings = await self.gather_findings(message, session)
+        with agent_stage(self.merge_agent.name, session and session.report):
+            response = await self.merge_agent.get_response(messages=self.build_merge_task(message, findings))
+            await self.record_usage(session and session.report, response)
+        return response.message
+
+    async def stream_agent(self, agent: ChatCompletionAgent, task: str, report: TokenReport = None) -> str:
+        """Stream one agent's answer as token events and return the full text."""
+        _current_agent.set(agent.name)
+        emit_event("agent_start")
+        parts = []
+        with agent_stage(agent.name, report):
+            async for item in agent.invoke_stream(messages=task):
+                # Every model call, tool-call rounds included, ends with a chunk carrying its usage
+                if report is not None:
+                    report.record_message(item.message, agent.name)
+                text = item.message.content
+                if text:
+                    parts.append(text)
+                    emit_event("token", text=text)
+        emit_event("agent_end")
+        _current_agent.set(None)
+        return "".join(parts)
+
+    async def chat_stream(self, user: str, message: str, heartbeat: float = None):
+        """
+        Async generator of chat events for `message` in the session of `user`:
+        agent_start/agent_end per agent, token chunks, tool_start/tool_end per tool
+        call, then done (or error). The done event carries the cache status and token
+        report, as returned by `chat`; a cached answer arrives as a single token event.
+
+        The orchestration runs in a background task; closing the generator (e.g. when
+        the client disconnects) cancels it. With `heartbeat` set, a heartbeat event is
+        yielded whenever nothing happened for that many seconds.
+        """
+        session = self.sessions.get(user)
+        async with session.lock:
+            session.start_turn()
+            async for event in self._chat_stream(session, message, heartbeat):
+                yield event
+
+    async def _chat_stream(self, session: ChatSession, message: str, heartbeat: float = None):
+        cached, status, ticket = await self.lookup_response(session, message)
+        if cached is not None:
+            await self.sessions.record(session, message, cached["answer"])
+            yield {"event": "token", "agent": cached["agent"], "text": cached["answer"]}
+            yield {"event": "done", "agent": None, "cache": "hit", "tokens": session.report.as_dict()}
+            return
+
+        if self.agents is None:
+            await self.start()
+        task = session.build_task(message)
+        queue = asyncio.Queue()
+        finished = object()
+
+        async def produce():
+            _event_sink.set(queue.put_nowait)
+            try:
+                if SK_ORCHESTRATION_MODE == "concurrent":
+                    findings = await self.gather_findings(task, session)
+                    last_agent = self.merge_agent
+                    answer = await self.stream_agent(last_agent, self.build_merge_task(task, findings), session.report)
+                else:
+                    # Same hand-off as SequentialOrchestration: each agent gets the previous answer
+                    answer = task
+                    for agent in self.agents:
+                        last_agent = self.for_session(agent, session)
+                        answer = await self.stream_agent(last_agent, answer, session.report)
+                self.store_response(status, ticket, {"agent": last_agent.name, "answer": answer})
+                await self.sessions.record(session, message, answer)
+                queue.put_nowait({"event": "done", "agent": None, "cache": status, "tokens": session.report.as_dict()})
+            except Exception as e:
+                logger.error(f"Chat stream error: {e}")
+                queue.put_nowait({"event": "error", "agent": _current_agent.get(), "detail": str(e)})
+            finally:
+                queue.put_nowait(finished)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield {"event": "heartbeat", "agent": None}
+                    continue
+                if event is finished:
+                    break
+                yield event
+        finally:
+            producer.cancel()
+
 
     improve_order_velocity_rules = """1. C2 CREDIT HOLDS: Improve Order Velocity
             a. If a C2 hold has not been released, reach out to Credit Team for support releasing the hold or next steps required
@@ -0,0 +1,339 @@
+import io
+import csv
+import os
+import json
+import base64
+import asyncio
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from .db import DB_SQLITE_PATH, TICKETS_TABLE, TICKETS_VERSION_COLUMN
+from .cache import TTLCache
+
+TICKET_COLUMNS = [
+    "ticket_number",
+    "creation_date",
+    "current_Status",
+    "assigned_to",
+    "priority",
+    "subject",
+    "any_other_comments",
+]
+
+# Keyset ordering: newest first, ticket_number breaks ties. SQL Server and SQLite both
+# sort NULL lowest, so tickets without a creation_date come last.
+CURSOR_COLUMNS = ["creation_date", "ticket_number"]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+TICKETS_CACHE_SIZE = int(os.getenv("TICKETS_CACHE_SIZE", "256"))
+TICKETS_CACHE_TTL = float(os.getenv("TICKETS_CACHE_TTL", "300"))
+# How long a change signal is trusted before the DB is asked again
+TICKETS_CHANGE_SIGNAL_TTL = float(os.getenv("TICKETS_CHANGE_SIGNAL_TTL", "5"))
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _encode_value(value):
+    # Tagged so the cursor decodes back to the column's own type; datetime is checked before date
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(row: dict) -> str:
+    """Build an opaque keyset cursor from the last row of a page."""
+    payload = json.dumps([_encode_value(row[column]) for column in CURSOR_COLUMNS])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    """Decode a cursor produced by `encode_cursor`. Raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != len(CURSOR_COLUMNS):
+        raise ValueError("Invalid cursor")
+    try:
+        return [_decode_value(value) for value in values]
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def parse_fields(fields: str = None) -> list:
+    """Turn a comma separated `fields` parameter into a validated column list."""
+    if not fields:
+        return list(TICKET_COLUMNS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in TICKET_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def build_filters(status: str = None, priority: str = None, assigned_to: str = None):
+    """Return (where clauses, params) for the equality filters that are set."""
+    clauses = []
+    params = []
+    for column, value in (("current_Status", status), ("priority", priority), ("assigned_to", assigned_to)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return clauses, params
+
+
+def build_tickets_query(columns: list, limit: int, cursor: list = None,
+                        status: str = None, priority: str = None, assigned_to: str = None):
+    """
+    Build a parameterized keyset-paginated tickets query.
+
+    The cursor columns are always selected so the next cursor can be computed,
+    even when they are not part of the requested projection.
+    """
+    select_columns = list(columns) + [column for column in CURSOR_COLUMNS if column not in columns]
+    clauses, params = build_filters(status, priority, assigned_to)
+    if cursor is not None:
+        creation_date, ticket_number = cursor
+        if creation_date is None:
+            clauses.append("(creation_date IS NULL AND ticket_number < ?)")
+            params.append(ticket_number)
+        else:
+            clauses.append(
+                "(creation_date < ? OR (creation_date = ? AND ticket_number < ?) OR creation_date IS NULL)"
+            )
+            params.extend([creation_date, creation_date, ticket_number])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order = "ORDER BY creation_date DESC, ticket_number DESC"
+    if DB_SQLITE_PATH:
+        sql = f"SELECT {', '.join(select_columns)} FROM {TICKETS_TABLE} {where} {order} LIMIT ?"
+    else:
+        sql = f"SELECT TOP (?) {', '.join(select_columns)} FROM {TICKETS_TABLE} {where} {order}"
+    params = params + [limit] if DB_SQLITE_PATH else [limit] + params
+    return sql, params
+
+
+def fetch_tickets_page(conn, columns: list, limit: int, cursor: list = None, **filters) -> dict:
+    """Fetch one page of tickets and the cursor for the next page (None on the last page)."""
+    # Ask for one extra row so we know whether another page exists without a COUNT(*)
+    sql, params = build_tickets_query(columns, limit + 1, cursor, **filters)
+    db_cursor = conn.cursor()
+    db_cursor.execute(sql, params)
+    names = [column[0] for column in db_cursor.description]
+    rows = [dict(zip(names, row)) for row in db_cursor.fetchmany(limit + 1)]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+
+    items = [{column: row[column] for column in columns} for row in rows]
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def fetch_change_signal(conn) -> str:
+    """
+    Cheap fingerprint of the tickets table: row count and newest creation_date,
+    plus the highest row version when TICKETS_VERSION_COLUMN is configured.
+    """
+    aggregates = ["COUNT(*)", "MAX(creation_date)"]
+    if TICKETS_VERSION_COLUMN:
+        if DB_SQLITE_PATH:
+            aggregates.append(f"MAX({TICKETS_VERSION_COLUMN})")
+        else:
+            aggregates.append(f"MAX(CAST({TICKETS_VERSION_COLUMN} AS BIGINT))")
+    db_cursor = conn.cursor()
+    db_cursor.execute(f"SELECT {', '.join(aggregates)} FROM {TICKETS_TABLE}")
+    return json.dumps(list(db_cursor.fetchone()), default=_json_default)
+
+
+class TicketsCache:
+    """
+    Result cache for `/api/tickets` keyed by query parameters.
+
+    Entries are tagged with an ETag derived from the table's change signal. The
+    signal itself is cached for `signal_ttl` seconds, which lets conditional
+    requests be answered with a 304 without touching the DB; when the signal
+    changes every cached page is dropped.
+
+    Only the version column sees updates to existing rows, so without one
+    (`tracks_updates` is False) nothing is cached and the ETag is a hash of the
+    page served (`page_etag`): a 304 then saves the transfer, not the query.
+    """
+
+    def __init__(self, maxsize: int = TICKETS_CACHE_SIZE, ttl: float = TICKETS_CACHE_TTL,
+                 signal_ttl: float = TICKETS_CHANGE_SIGNAL_TTL, version_column: str = TICKETS_VERSION_COLUMN):
+        self.tracks_updates = bool(version_column)
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._signal = TTLCache(maxsize=1, ttl=signal_ttl)
+        self._last_signal = None
+        self._lock = asyncio.Lock()
+
+    async def change_signal(self, pool) -> str:
+        signal = self._signal.get("signal")
+        if signal is not None:
+            return signal
+        async with self._lock:
+            signal = self._signal.get("signal")
+            if signal is None:
+                signal = await pool.run(fetch_change_signal)
+                if signal != self._last_signal:
+                    self.results.clear()
+                    self._last_signal = signal
+                self._signal.set("signal", signal)
+        return signal
+
+    def invalidate(self):
+        """Forget the change signal and every cached page."""
+        self._signal.clear()
+        self.results.clear()
+
+    @staticmethod
+    def etag(signal: str, key: tuple) -> str:
+        digest = hashlib.sha1(json.dumps([signal, key], default=_json_default).encode()).hexdigest()
+        return f'"{digest}"'
+
+    @staticmethod
+    def page_etag(body: bytes) -> str:
+        return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def build_changes_query(columns: list, since: int, limit: int, horizon: int = None):
+    """
+    Build a query for rows whose version is above the `since` watermark, oldest change first.
+
+    On SQL Server the version column is a rowversion, compared as BINARY(8) so the
+    predicate can use an index on it, and only versions below `horizon` (the
+    MIN_ACTIVE_ROWVERSION() read before the query) are returned; the SQLite
+    stand-in uses a plain integer column bumped by triggers.
+    """
+    version = TICKETS_VERSION_COLUMN
+    if DB_SQLITE_PATH:
+        sql = (f"SELECT {', '.join(columns)}, {version} AS _version FROM {TICKETS_TABLE} "
+               f"WHERE {version} > ? ORDER BY {version} LIMIT ?")
+        return sql, [since, limit]
+    sql = (f"SELECT TOP (?) {', '.join(columns)}, CAST({version} AS BIGINT) AS _version FROM {TICKETS_TABLE} "
+           f"WHERE {version} > CAST(CAST(? AS BIGINT) AS BINARY(8)) "
+           f"AND {version} < CAST(CAST(? AS BIGINT) AS BINARY(8)) ORDER BY {version}")
+    return sql, [limit, since, horizon]
+
+
+def fetch_ticket_changes(conn, columns: list, since: int, limit: int) -> dict:
+    """
+    Fetch tickets inserted or updated after the `since` watermark.
+
+    Returns the changed rows, the watermark to send on the next call and whether
+    more changes are waiting. Deleted rows are not reported.
+    """
+    db_cursor = conn.cursor()
+    horizon = None
+    if not DB_SQLITE_PATH:
+        # A transaction still in flight may commit a version lower than ones already
+        # visible; stop below the oldest active one so the watermark never skips it
+        db_cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)")
+        horizon = int(db_cursor.fetchone()[0])
+    sql, params = build_changes_query(columns, since, limit + 1, horizon)
+    db_cursor.execute(sql, params)
+    rows = db_cursor.fetchmany(limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [dict(zip(columns, row[:-1])) for row in rows]
+    if has_more or horizon is None:
+        watermark = int(rows[-1][-1]) if rows else since
+    else:
+        # Every version below the horizon is committed and has been returned
+        watermark = max(since, horizon - 1)
+    return {"items": items, "watermark": watermark, "has_more": has_more}
+
+
+def build_export_query(columns: list, status: str = None, priority: str = None, assigned_to: str = None):
+    """Build the unpaginated query used by the streaming export."""
+    clauses, params = build_filters(status, priority, assigned_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"SELECT {', '.join(columns)} FROM {TICKETS_TABLE} {where} ORDER BY creation_date DESC, ticket_number DESC"
+    return sql, params
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _encode_ndjson(columns: list, rows: list) -> bytes:
+    return "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows).encode()
+
+
+def _encode_csv(rows: list) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def stream_tickets(pool, columns: list, fmt: str = "ndjson", batch_size: int = EXPORT_BATCH_SIZE, **filters):
+    """
+    Stream tickets as NDJSON or CSV, reading `batch_size` rows at a time with `fetchmany`.
+
+    Each batch is only fetched once the previous chunk has been handed to the client,
+    so a slow reader holds back the DB read instead of growing server memory.
+    Exports wait for one of the pool's export slots, so they cannot take every
+    connection away from the paginated tickets API.
+    """
+    if pool.export_slots is None:
+        raise RuntimeError("Exports need a DB pool of at least 2 connections")
+    sql, params = build_export_query(columns, **filters)
+    loop = asyncio.get_running_loop()
+    async with pool.export_slots:
+        conn = await loop.run_in_executor(pool.export_executor, pool.acquire)
+        broken = False
+        try:
+            db_cursor = conn.raw.cursor()
+            await loop.run_in_executor(pool.export_executor, db_cursor.execute, sql, params)
+            if fmt == "csv":
+                yield _encode_csv([columns])
+            while True:
+                rows = await loop.run_in_executor(pool.export_executor, db_cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                yield _encode_csv(rows) if fmt == "csv" else _encode_ndjson(columns, rows)
+        except BaseException:
+            # Includes client disconnects; a half-read cursor is not safe to hand back to the pool
+            broken = True
+            raise
+        finally:
+            # Releasing rolls back and may close the connection: keep it off the event loop too
+            await loop.run_in_executor(pool.export_executor, pool.release, conn, broken)
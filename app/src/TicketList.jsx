@@ -1,29 +1,53 @@
-import React, { useEffect, useState } from "react";
+import React, { useCallback, useEffect, useState } from "react";
+
+const TICKETS_URL = "https://zany-space-bassoon-jvxgqxrg5q9h45g-8000.app.github.dev/api/tickets";
+const PAGE_SIZE = 50;
 
 function Tickets() {
   const [tickets, setTickets] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  // Fetch a single page; the API returns { items, next_cursor }
+  const loadPage = useCallback((cursor) => {
+    const params = new URLSearchParams({
+      limit: PAGE_SIZE,
+      fields: "ticket_number,subject",
+    });
+    if (cursor) params.set("cursor", cursor);
+
+    setLoading(true);
+    fetch(`${TICKETS_URL}?${params}`)
+      .then((res) => res.json())
+      .then((data) => {
+        setTickets((prev) => (cursor ? [...prev, ...data.items] : data.items));
+        setNextCursor(data.next_cursor);
+      })
+      .catch((err) => console.error("Error fetching tickets:", err))
+      .finally(() => setLoading(false));
+  }, []);
 
-  // ...existing code...
-useEffect(() => {
-  fetch("https://zany-space-bassoon-jvxgqxrg5q9h45g-8000.app.github.dev/api/tickets")
-    .then((res) => res.json())
-    .then((data) => setTickets(data))
-    .catch((err) => console.error("Error fetching tickets:", err));
-}, []);
-// ...existing code...
+  useEffect(() => {
+    loadPage(null);
+  }, [loadPage]);
 
   return (
     <div>
       <h2>Tickets</h2>
       <ul>
-        {tickets.map((ticket, idx) => (
-          <li key={idx}>
+        {tickets.map((ticket) => (
+          <li key={ticket.ticket_number}>
             {ticket.ticket_number} - {ticket.subject}
           </li>
         ))}
       </ul>
+      {nextCursor && (
+        <button onClick={() => loadPage(nextCursor)} disabled={loading}>
+          {loading ? "Loading..." : "Load more"}
+        </button>
+      )}
     </div>
   );
 }
 
-export default Tickets;
\ No newline at end of file
+export default Tickets;
@@ -0,0 +1,158 @@
+"""
+Local stand-in for Azure OpenAI (chat completions and embeddings) and Azure AI
+Search, used by the benchmark. Run with uvicorn; latency and failures are set
+through environment variables:
+
+- FAKE_CHAT_LATENCY_MS, FAKE_EMBEDDINGS_LATENCY_MS, FAKE_SEARCH_LATENCY_MS: mean latency per call
+- FAKE_LATENCY_JITTER: relative jitter of those latencies (0.2 = +-20%)
+- FAKE_THROTTLE_RATE: share of calls answered 429 with a Retry-After
+- FAKE_ERROR_RATE: share of calls answered 500
+- FAKE_SEED: seed of the random generator, for reproducible runs
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHAT_LATENCY = float(os.getenv("FAKE_CHAT_LATENCY_MS", "300")) / 1000
+EMBEDDINGS_LATENCY = float(os.getenv("FAKE_EMBEDDINGS_LATENCY_MS", "30")) / 1000
+SEARCH_LATENCY = float(os.getenv("FAKE_SEARCH_LATENCY_MS", "50")) / 1000
+LATENCY_JITTER = float(os.getenv("FAKE_LATENCY_JITTER", "0.2"))
+THROTTLE_RATE = float(os.getenv("FAKE_THROTTLE_RATE", "0"))
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+EMBEDDING_DIMENSIONS = 64
+# Delay between the chunks of a streamed answer
+STREAM_CHUNK_DELAY = 0.01
+
+random.seed(int(os.getenv("FAKE_SEED", "0")))
+
+app = FastAPI(title="Benchmark stand-ins")
+calls = {"chat": 0, "embeddings": 0, "search": 0, "throttled": 0, "failed": 0}
+
+
+async def delay(mean: float):
+    if mean > 0:
+        await asyncio.sleep(max(0.0, random.gauss(mean, mean * LATENCY_JITTER)))
+
+
+def injected_failure():
+    """A 429 or 500 response for the configured share of calls, else None."""
+    roll = random.random()
+    if roll < THROTTLE_RATE:
+        calls["throttled"] += 1
+        return JSONResponse({"error": {"code": "429", "message": "Rate limit"}}, 429, headers={"Retry-After": "1"})
+    if roll < THROTTLE_RATE + ERROR_RATE:
+        calls["failed"] += 1
+        return JSONResponse({"error": {"code": "500", "message": "Injected failure"}}, 500)
+    return None
+
+
+def embedding(text: str) -> list:
+    """Deterministic unit vector derived from the text."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    vector = [(digest[i % len(digest)] - 127.5) / 127.5 for i in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def tool_arguments(tool: dict) -> dict:
+    """Plausible arguments for a tool from its JSON schema."""
+    parameters = tool["function"].get("parameters") or {}
+    arguments = {}
+    for name in parameters.get("required", []):
+        kind = parameters.get("properties", {}).get(name, {}).get("type")
+        arguments[name] = 3 if kind in ("integer", "number") else "top accounts to prioritize"
+    return arguments
+
+
+def chat_message(body: dict) -> tuple:
+    """The assistant message: a call of the first tool, then an answer once tool results are in."""
+    messages = body["messages"]
+    tools = body.get("tools")
+    if tools and not any(message.get("role") == "tool" for message in messages):
+        tool = tools[0]
+        call = {"id": f"call_{random.getrandbits(32):08x}", "type": "function",
+                "function": {"name": tool["function"]["name"], "arguments": json.dumps(tool_arguments(tool))}}
+        return {"role": "assistant", "content": None, "tool_calls": [call]}, "tool_calls"
+    answer = ("Prioritize Contoso first: two C2 credit holds past their release date, then Fabrikam "
+              "for 45k past due AR. Reach out to the Credit Team for both accounts.")
+    return {"role": "assistant", "content": answer}, "stop"
+
+
+def usage(body: dict, message: dict) -> dict:
+    prompt_tokens = len(json.dumps(body["messages"])) // 4
+    completion_tokens = len(json.dumps(message)) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": 0}}
+
+
+async def stream_chat(body: dict, message: dict, finish_reason: str):
+    base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": "bench"}
+    if message.get("tool_calls"):
+        call = message["tool_calls"][0]
+        delta = {"role": "assistant", "tool_calls": [{"index": 0, **call}]}
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+    else:
+        for word in message["content"].split(" "):
+            delta = {"content": word + " "}
+            yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+            await asyncio.sleep(STREAM_CHUNK_DELAY)
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}]})}\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage(body, message)})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/{path:path}")
+async def handle(path: str, request: Request):
+    body = await request.json()
+    if path.endswith("chat/completions"):
+        calls["chat"] += 1
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+        message, finish_reason = chat_message(body)
+        if body.get("stream"):
+            # Time to first token; the rest of the answer is streamed in chunks
+            await delay(CHAT_LATENCY / 2)
+            return StreamingResponse(stream_chat(body, message, finish_reason), media_type="text/event-stream")
+        await delay(CHAT_LATENCY)
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": "bench",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage(body, message),
+        }
+    if path.endswith("embeddings"):
+        calls["embeddings"] += 1
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+        await delay(EMBEDDINGS_LATENCY)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": sum(len(text) // 4 for text in texts), "total_tokens": 0},
+        }
+    if "docs/search" in path:
+        calls["search"] += 1
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+        await delay(SEARCH_LATENCY)
+        top = body.get("top") or 3
+        return {"value": [
+            {"@search.score": 1.0 - i / 10, "account_name": f"Account {i}", "content": f"Benchmark document {i} for {path}."}
+            for i in range(top)
+        ]}
+    return JSONResponse({"error": {"code": "404", "message": f"Unknown path {path}"}}, 404)
+
+
+@app.get("/calls")
+def get_calls():
+    return calls
@@ -0,0 +1,426 @@
+"""
+Offline benchmark of the API.
+
+Starts the stand-ins of bench/fakes.py (over TLS with a throwaway certificate,
+as the OpenAI client requires an https endpoint) and the API itself on a seeded
+SQLite tickets DB, runs load scenarios at several concurrency levels and reports
+p50/p95/p99 latency, throughput, errors, the API's start-up time and its memory. Results are saved
+as JSON so runs can be compared across commits:
+
+    python -m bench.run
+    python -m bench.run --scenarios tickets --concurrency 1 16 64 --duration 5
+    python -m bench.run --compare bench_results/<commit>.json
+
+The API runs with its usual configuration; export any setting from sample.env
+(e.g. SK_ORCHESTRATION_MODE=concurrent) to benchmark it.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import ipaddress
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from api.db import SQLITE_TICKETS_SCHEMA
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "Which accounts should we prioritize this week?",
+    "What are the Next Best Actions for Contoso?",
+    "Which accounts have credit holds past their release date?",
+    "Rank my accounts by past due AR.",
+    "Which orders are on hold for Fabrikam and why?",
+    "What should the customer care team do first for Tailspin Toys?",
+]
+STATUSES = ["Open", "In Progress", "Pending", "Resolved", "Closed"]
+PRIORITIES = ["Low", "Medium", "High", "Critical"]
+ASSIGNEES = [f"agent{i}@contoso.com" for i in range(20)]
+
+# Default concurrency levels per scenario
+SCENARIO_LEVELS = {
+    "tickets": [1, 8, 32],
+    "chat": [1, 4, 16],
+    "chat_stream": [1, 4, 16],
+}
+
+
+def seed_tickets(path: str, count: int, seed: int):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executescript(SQLITE_TICKETS_SCHEMA)
+    conn.executemany(
+        "INSERT INTO voice_tickets (ticket_number, creation_date, current_Status, assigned_to, priority, "
+        "subject, any_other_comments) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                f"TCK{i:07d}",
+                (start + timedelta(minutes=rng.randrange(0, 60 * 24 * 365))).isoformat(sep=" "),
+                rng.choice(STATUSES),
+                rng.choice(ASSIGNEES),
+                rng.choice(PRIORITIES),
+                f"Order {rng.randrange(10**6):06d} held for review",
+                "Customer asked for an update on the order hold. " * rng.randrange(1, 4),
+            )
+            for i in range(count)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_certificate(directory: str) -> tuple:
+    """Self-signed certificate for 127.0.0.1; returns (certfile, keyfile)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(key.public_key()), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    certfile = os.path.join(directory, "bench-cert.pem")
+    keyfile = os.path.join(directory, "bench-key.pem")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app: str, port: int, env: dict, log_path: str, *args) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", *args],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, process: subprocess.Popen, log_path: str, timeout: float = 60, **kwargs):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as f:
+                raise RuntimeError(f"Server for {url} exited:\n{f.read()[-2000:]}")
+        try:
+            httpx.get(url, timeout=1, **kwargs)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server for {url} did not start within {timeout}s")
+
+
+def read_memory(pid: int) -> dict:
+    """Resident and peak resident memory of `pid` in MB (Linux), else empty."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1),
+        "peak_rss_mb": round(int(fields["VmHWM"].split()[0]) / 1024, 1),
+    }
+
+
+def measure_import(env: dict) -> dict:
+    """Time and peak memory of a fresh `import api.main`, which every worker pays when it spawns."""
+    code = (
+        "import json, time, resource; start = time.perf_counter(); import api.main; "
+        "print(json.dumps({'import_seconds': round(time.perf_counter() - start, 3), "
+        "'import_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}))"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def percentile(values: list, p: float) -> float:
+    """`p`th percentile of sorted `values`, linearly interpolated."""
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def latency_summary(seconds: list) -> dict:
+    values = sorted(value * 1000 for value in seconds)
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+async def tickets_request(client: httpx.AsyncClient, rng: random.Random, worker: int, i: int) -> dict:
+    params = {"limit": rng.choice([25, 50, 100])}
+    if rng.random() < 0.5:
+        params["status"] = rng.choice(STATUSES)
+    if rng.random() < 0.3:
+        params["fields"] = "ticket_number,subject,priority"
+    response = await client.get("/api/tickets", params=params)
+    response.raise_for_status()
+    return {}
+
+
+async def chat_request(client: httpx.AsyncClient, rng: random.Random, worker: int, i: int) -> dict:
+    response = await client.post(
+        "/chat", json={"user": f"bench-{worker}-{i}", "message": rng.choice(QUESTIONS)}
+    )
+    response.raise_for_status()
+    return {}
+
+
+async def chat_stream_request(client: httpx.AsyncClient, rng: random.Random, worker: int, i: int) -> dict:
+    started = time.perf_counter()
+    first_token = None
+    payload = {"user": f"bench-stream-{worker}-{i}", "message": rng.choice(QUESTIONS)}
+    async with client.stream("POST", "/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line == "event: token" and first_token is None:
+                first_token = time.perf_counter() - started
+            elif line == "event: error":
+                raise RuntimeError("Chat stream reported an error")
+    return {"ttft": first_token} if first_token is not None else {}
+
+
+SCENARIOS = {
+    "tickets": tickets_request,
+    "chat": chat_request,
+    "chat_stream": chat_stream_request,
+}
+
+
+async def run_level(base_url: str, request, concurrency: int, duration: float, warmup: int, seed: int) -> dict:
+    """Closed-loop load: `concurrency` clients send requests back to back for `duration` seconds."""
+    latencies, extras, errors = [], {}, []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        warm_rng = random.Random(seed)
+        for i in range(warmup):
+            try:
+                await request(client, warm_rng, -1, i)
+            except Exception:
+                pass
+
+        deadline = time.perf_counter() + duration
+
+        async def worker(index: int):
+            rng = random.Random(seed + index + 1)
+            i = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    extra = await request(client, rng, index, i)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                else:
+                    latencies.append(time.perf_counter() - started)
+                    for key, value in extra.items():
+                        extras.setdefault(key, []).append(value)
+                i += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": latency_summary(latencies),
+    }
+    for key, values in extras.items():
+        result[f"{key}_ms"] = latency_summary(values)
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict, baseline: dict = None):
+    previous = {}
+    if baseline:
+        previous = {(run["scenario"], run["concurrency"]): run for run in baseline["runs"]}
+    print(f"\ncommit {results['commit']}" + (f"  vs  {baseline['commit']}" if baseline else ""))
+    header = f"{'scenario':<12} {'conc':>4} {'reqs':>6} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>7}"
+    print(header)
+    print("-" * len(header))
+    for run in results["runs"]:
+        latency = run["latency_ms"]
+        line = (f"{run['scenario']:<12} {run['concurrency']:>4} {run['requests']:>6} {run['errors']:>4} "
+                f"{run['throughput_rps']:>8} {latency.get('p50', '-'):>9} {latency.get('p95', '-'):>9} "
+                f"{latency.get('p99', '-'):>9} {run.get('memory', {}).get('rss_mb', '-'):>7}")
+        print(line)
+        old = previous.get((run["scenario"], run["concurrency"]))
+        if old:
+            def change(new, before):
+                return f"{(new - before) / before * 100:+.1f}%" if new is not None and before else "-"
+            old_latency = old["latency_ms"]
+            print(f"{'':<12} {'':>4} {'':>6} {'':>4} {change(run['throughput_rps'], old['throughput_rps']):>8} "
+                  f"{change(latency.get('p50'), old_latency.get('p50')):>9} "
+                  f"{change(latency.get('p95'), old_latency.get('p95')):>9} "
+                  f"{change(latency.get('p99'), old_latency.get('p99')):>9} "
+                  f"{change(run.get('memory', {}).get('rss_mb'), old.get('memory', {}).get('rss_mb')):>7}")
+    startup = results.get("startup")
+    if startup:
+        print(f"\nimport api.main: {startup['import_seconds']}s, {startup['import_peak_rss_mb']} MB peak; "
+              f"API ready in {startup['ready_seconds']}s at {startup['idle'].get('rss_mb')} MB")
+        old = (baseline or {}).get("startup")
+        if old:
+            print(f"  before: {old['import_seconds']}s, {old['import_peak_rss_mb']} MB peak; "
+                  f"ready in {old['ready_seconds']}s at {old['idle'].get('rss_mb')} MB")
+    if results.get("memory"):
+        print(f"API peak RSS: {results['memory'].get('peak_rss_mb')} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against local stand-ins.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int,
+                        help="Concurrency levels for every scenario (default: per scenario)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per level")
+    parser.add_argument("--warmup", type=int, default=5, help="Requests sent before each level is measured")
+    parser.add_argument("--tickets", type=int, default=20000, help="Rows in the SQLite tickets table")
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    parser.add_argument("--embeddings-latency-ms", type=float, default=30)
+    parser.add_argument("--search-latency-ms", type=float, default=50)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative jitter of the stand-in latencies")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Share of upstream calls answered 429")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of upstream calls answered 500")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Result file (default: bench_results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="tyche-bench-")
+    db_path = os.path.join(workdir, "tickets.db")
+    seed_tickets(db_path, args.tickets, args.seed)
+    certfile, keyfile = make_certificate(workdir)
+    fake_port, api_port = free_port(), free_port()
+    fake_url = f"https://127.0.0.1:{fake_port}"
+
+    fake_env = {
+        **os.environ,
+        "FAKE_CHAT_LATENCY_MS": str(args.chat_latency_ms),
+        "FAKE_EMBEDDINGS_LATENCY_MS": str(args.embeddings_latency_ms),
+        "FAKE_SEARCH_LATENCY_MS": str(args.search_latency_ms),
+        "FAKE_LATENCY_JITTER": str(args.jitter),
+        "FAKE_THROTTLE_RATE": str(args.throttle_rate),
+        "FAKE_ERROR_RATE": str(args.error_rate),
+        "FAKE_SEED": str(args.seed),
+    }
+    api_env = {
+        **os.environ,
+        "AZURE_OPENAI_ENDPOINT": f"{fake_url}/openai/deployments/bench",
+        "AZURE_OPENAI_KEY": "bench",
+        "AZURE_OPENAI_DEPLOYMENT": "bench",
+        "AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT": "bench-embeddings",
+        "AZURE_OPENAI_EMBEDDINGS_ENDPOINT": f"{fake_url}/openai/deployments/bench-embeddings/embeddings",
+        "AZURE_SEARCH_ENDPOINT": fake_url,
+        "AZURE_SEARCH_KEY": "bench",
+        "IMPROVE_ORDER_VELOCITY_INDEX_NAME": os.getenv("IMPROVE_ORDER_VELOCITY_INDEX_NAME", "improve-order-velocity"),
+        "DB_SQLITE_PATH": db_path,
+        "TICKETS_VERSION_COLUMN": "row_version",
+        "BATCH_JOBS_DIR": os.path.join(workdir, "batch_jobs"),
+        "EMAIL_OUTBOX_PATH": os.path.join(workdir, "email_outbox.db"),
+        # The API trusts the stand-ins' certificate
+        "SSL_CERT_FILE": certfile,
+    }
+
+    fake_log, api_log = os.path.join(workdir, "fakes.log"), os.path.join(workdir, "api.log")
+    fakes = start_server("bench.fakes:app", fake_port, fake_env, fake_log,
+                         "--ssl-certfile", certfile, "--ssl-keyfile", keyfile)
+    api = None
+    try:
+        wait_ready(f"{fake_url}/calls", fakes, fake_log, verify=certfile)
+        startup = measure_import(api_env)
+        started = time.perf_counter()
+        api = start_server("api.main:app", api_port, api_env, api_log)
+        wait_ready(f"http://127.0.0.1:{api_port}/health", api, api_log)
+        startup.update(ready_seconds=round(time.perf_counter() - started, 3), idle=read_memory(api.pid))
+
+        results = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "startup": startup,
+            "runs": [],
+        }
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency or SCENARIO_LEVELS[scenario]:
+                print(f"{scenario} at concurrency {concurrency}...", flush=True)
+                run = asyncio.run(run_level(f"http://127.0.0.1:{api_port}", SCENARIOS[scenario], concurrency,
+                                            args.duration, args.warmup, args.seed))
+                run = {"scenario": scenario, **run, "memory": read_memory(api.pid)}
+                results["runs"].append(run)
+        results["memory"] = read_memory(api.pid)
+        results["upstream_calls"] = httpx.get(f"{fake_url}/calls", verify=certfile).json()
+    finally:
+        for process in (api, fakes):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    output = args.output or os.path.join(ROOT, "bench_results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\nResults written to {output}; server logs in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
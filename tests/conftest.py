@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The API reads its settings when its modules are imported: point everything that
+# touches disk at a throwaway directory and the DB at the SQLite stand-in first.
+_workdir = tempfile.mkdtemp(prefix="tyche-tests-")
+os.environ.setdefault("DB_SQLITE_PATH", os.path.join(_workdir, "tickets.db"))
+os.environ.setdefault("TICKETS_VERSION_COLUMN", "row_version")
+os.environ.setdefault("BATCH_JOBS_DIR", os.path.join(_workdir, "batch_jobs"))
+os.environ.setdefault("EMAIL_OUTBOX_PATH", os.path.join(_workdir, "email_outbox.db"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
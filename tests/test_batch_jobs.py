@@ -0,0 +1,139 @@
+import json
+import time
+import asyncio
+
+from api.batch_jobs import BatchJobRunner, BatchJobStore
+
+
+class FakeSessions:
+    def pop(self, user):
+        return None
+
+
+class FakeAgent:
+    """Answers every question after `delay` seconds and counts the calls."""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.questions = []
+        self.sessions = FakeSessions()
+
+    async def chat(self, user, question, lane=None):
+        self.questions.append(question)
+        await asyncio.sleep(self.delay)
+        return {"agent": "Fake", "answer": f"answer to {question}", "cache": "off", "tokens": {"total": 1}}
+
+
+def runner(directory, agent, **kwargs):
+    async def get_agent():
+        return agent
+    return BatchJobRunner(get_agent, BatchJobStore(str(directory), **kwargs), workers=2)
+
+
+async def wait_for_status(store, job_id, *statuses, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        job = store.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job stayed {store.get(job_id)['status']}")
+
+
+def test_job_runs_every_item_once(tmp_path):
+    async def scenario():
+        agent = FakeAgent()
+        jobs = runner(tmp_path, agent)
+        job = await jobs.submit("queries", [f"q{i}" for i in range(5)])
+        job = await wait_for_status(jobs.store, job["id"], "completed")
+        assert (job["done"], job["failed"], job["progress"]) == (5, 0, 1.0)
+        with open(jobs.store.results_path(job["id"])) as f:
+            assert sorted(json.loads(line)["index"] for line in f) == list(range(5))
+        await jobs.stop()
+
+    asyncio.run(scenario())
+
+
+def test_each_unfinished_job_is_resumed_by_one_worker_only(tmp_path):
+    async def scenario():
+        store = BatchJobStore(str(tmp_path))
+        job_id = store.create("queries", [f"q{i}" for i in range(6)])
+        store.close()
+
+        agents = [FakeAgent(), FakeAgent(), FakeAgent()]
+        workers = [runner(tmp_path, agent) for agent in agents]
+        for worker in workers:
+            worker.resume()
+        await wait_for_status(workers[0].store, job_id, "completed")
+        assert sorted(len(agent.questions) for agent in agents) == [0, 0, 6]
+        for worker in workers:
+            await worker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_from_another_worker_stops_the_job(tmp_path):
+    async def scenario():
+        agent = FakeAgent(delay=0.05)
+        owner, other = runner(tmp_path, agent), runner(tmp_path, FakeAgent())
+        job = await owner.submit("queries", [f"q{i}" for i in range(40)])
+        await asyncio.sleep(0.12)
+        assert (await other.cancel(job["id"]))["status"] == "cancelled"
+        await asyncio.sleep(0.2)
+        job = owner.store.get(job["id"])
+        # The owner stopped after the items in flight and did not overwrite the cancel
+        assert job["status"] == "cancelled"
+        assert len(agent.questions) < 40 and job["pending"] > 0
+        await owner.stop()
+        await other.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stopped_jobs_are_released_and_resumed_elsewhere(tmp_path):
+    async def scenario():
+        first = runner(tmp_path, FakeAgent(delay=0.05))
+        job = await first.submit("queries", [f"q{i}" for i in range(20)])
+        await asyncio.sleep(0.1)
+        await first.stop()
+        assert BatchJobStore(str(tmp_path)).get(job["id"])["status"] == "running"
+
+        agent = FakeAgent()
+        second = runner(tmp_path, agent)
+        second.resume()
+        job = await wait_for_status(second.store, job["id"], "completed")
+        assert job["done"] == 20 and len(agent.questions) < 20
+        await second.stop()
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    store = BatchJobStore(str(tmp_path), lease_seconds=0.05)
+    job_id = store.create("queries", ["q"], owner="crashed")
+    assert not store.claim(job_id, "other")
+    asyncio.run(asyncio.sleep(0.1))
+    assert store.claim(job_id, "other")
+    assert not store.renew(job_id, "crashed")
+    store.close()
+
+
+def test_store_io_does_not_block_the_event_loop(tmp_path):
+    async def scenario():
+        jobs = runner(tmp_path, FakeAgent(delay=0))
+        finish_item = jobs.store.finish_item
+
+        def slow_finish_item(*args):
+            time.sleep(0.1)
+            finish_item(*args)
+
+        jobs.store.finish_item = slow_finish_item
+        job = await jobs.submit("queries", ["q0", "q1"])
+        ticks = 0
+        while jobs.store.get(job["id"])["status"] != "completed":
+            await asyncio.sleep(0.01)
+            ticks += 1
+        # The loop kept running while the checkpoints were written
+        assert ticks >= 5
+        await jobs.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import time
+import asyncio
+
+import pytest
+
+from api import db
+from api.db import ConnectionPool
+
+
+def test_uses_the_sqlite_stand_in():
+    pool = ConnectionPool(size=1)
+    try:
+        assert asyncio.run(pool.run(lambda conn: conn.execute("SELECT 1").fetchone()[0])) == 1
+        with pool.connection() as conn:
+            assert conn.execute("PRAGMA database_list").fetchone()[2] == db.DB_SQLITE_PATH
+    finally:
+        pool.close()
+
+
+def test_reuses_idle_connections():
+    pool = ConnectionPool(size=2)
+    try:
+        first = pool.acquire()
+        pool.release(first)
+        assert pool.acquire() is first
+        assert pool._opened == 1
+    finally:
+        pool.close()
+
+
+def test_checkout_replaces_an_unhealthy_connection():
+    pool = ConnectionPool(size=1)
+    try:
+        conn = pool.acquire()
+        pool.release(conn)
+        # The server dropped the connection while it sat idle
+        conn.raw.close()
+        replacement = pool.acquire()
+        assert replacement is not conn
+        assert replacement.raw.execute("SELECT 1").fetchone() == (1,)
+        assert pool._opened == 1
+    finally:
+        pool.close()
+
+
+def test_recycles_old_connections():
+    pool = ConnectionPool(size=1, recycle_seconds=0.05)
+    try:
+        conn = pool.acquire()
+        pool.release(conn)
+        time.sleep(0.1)
+        replacement = pool.acquire()
+        assert replacement is not conn
+        assert pool._opened == 1
+    finally:
+        pool.close()
+
+
+def test_broken_connections_are_not_returned_to_the_pool():
+    pool = ConnectionPool(size=1)
+    try:
+        with pytest.raises(ValueError):
+            with pool.connection():
+                raise ValueError("query failed")
+        assert pool._opened == 0
+        assert pool._idle.empty()
+    finally:
+        pool.close()
+
+
+def test_exhausted_pool_times_out_until_a_connection_is_released():
+    pool = ConnectionPool(size=1, timeout=0.1)
+    try:
+        conn = pool.acquire()
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            pool.acquire()
+        assert time.monotonic() - started >= 0.1
+        pool.release(conn)
+        assert pool.acquire() is conn
+    finally:
+        pool.close()
+
+
+def test_closed_pool_refuses_checkouts():
+    pool = ConnectionPool(size=1)
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_single_connection_pool_has_no_export_slots():
+    pool = ConnectionPool(size=1)
+    try:
+        assert pool.export_slots is None and pool.export_executor is None
+    finally:
+        pool.close()
+    pool = ConnectionPool(size=3)
+    try:
+        assert pool.export_slots._value == 2
+    finally:
+        pool.close()
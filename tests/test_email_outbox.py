@@ -0,0 +1,217 @@
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api.plugins import clients, email_outbox
+from api.plugins.email_outbox import EmailOutbox
+
+
+class LogicApp:
+    """Local HTTP stand-in for a Logic App endpoint, answering with the scripted statuses then 200."""
+
+    def __init__(self, statuses=(), delay: float = 0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        app = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                app.requests.append((self.headers["Idempotency-Key"], body))
+                time.sleep(app.delay)
+                status = app.statuses.pop(0) if app.statuses else 200
+                self.send_response(status)
+                if status != 200:
+                    self.send_header("Retry-After-Ms", "10")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def logic_app():
+    apps = []
+
+    def start(*args, **kwargs):
+        apps.append(LogicApp(*args, **kwargs))
+        return apps[-1]
+
+    yield start
+    for app in apps:
+        app.close()
+
+
+def run(scenario):
+    """Run `scenario` with its own shared HTTP client, as the client is bound to the event loop."""
+    async def main():
+        clients._http_client = None
+        try:
+            await scenario()
+        finally:
+            await clients.get_http_client().aclose()
+            clients._http_client = None
+
+    asyncio.run(main())
+
+
+async def wait_until_settled(outbox, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if outbox.stats()["pending"] == 0:
+            return outbox.stats()
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"emails still pending: {outbox.stats()}")
+
+
+def test_retries_throttled_and_failed_deliveries_with_the_same_key(tmp_path, logic_app):
+    app = logic_app(statuses=[429, 500])
+
+    async def scenario():
+        outbox = EmailOutbox(str(tmp_path / "outbox.db"), digest_seconds=0)
+        assert outbox.enqueue(app.url, "Order held", "Order 42 is held")
+        assert await wait_until_settled(outbox) == {"pending": 0, "sent": 1, "failed": 0}
+        await outbox.stop()
+
+    run(scenario)
+    assert len(app.requests) == 3
+    assert len({key for key, _ in app.requests}) == 1
+    assert app.requests[0][1] == {"email_subject": "Order held", "email_body": "Order 42 is held"}
+
+
+def test_worker_survives_outbox_errors(tmp_path, logic_app, monkeypatch, caplog):
+    app = logic_app()
+    monkeypatch.setattr(email_outbox, "EMAIL_RETRY_BASE_SECONDS", 0.01)
+
+    async def scenario():
+        outbox = EmailOutbox(str(tmp_path / "outbox.db"), digest_seconds=0)
+        purge, failures = outbox._purge, [sqlite3.OperationalError("database is locked")] * 2
+
+        def flaky_purge():
+            if failures:
+                raise failures.pop()
+            purge()
+
+        outbox._purge = flaky_purge
+        outbox.enqueue(app.url, "First", "one")
+        await wait_until_settled(outbox)
+        # The worker keeps going after each failure instead of ending until the next enqueue
+        for _ in range(200):
+            if not failures:
+                break
+            await asyncio.sleep(0.01)
+        assert not failures and not outbox._worker.done()
+        outbox.enqueue(app.url, "Second", "two")
+        assert await wait_until_settled(outbox) == {"pending": 0, "sent": 2, "failed": 0}
+        await outbox.stop()
+
+    run(scenario)
+    assert "database is locked" in caplog.text
+
+
+def test_gives_up_on_permanent_errors(tmp_path, logic_app):
+    app = logic_app(statuses=[400])
+
+    async def scenario():
+        outbox = EmailOutbox(str(tmp_path / "outbox.db"), digest_seconds=0)
+        outbox.enqueue(app.url, "Order held", "Order 42 is held")
+        assert await wait_until_settled(outbox) == {"pending": 0, "sent": 0, "failed": 1}
+        await outbox.stop()
+
+    run(scenario)
+    assert len(app.requests) == 1
+
+
+def test_same_request_is_sent_once_but_a_new_one_is_sent_again(tmp_path, logic_app):
+    app = logic_app()
+
+    async def scenario():
+        outbox = EmailOutbox(str(tmp_path / "outbox.db"), digest_seconds=0)
+        assert outbox.enqueue(app.url, "Order held", "Order 42 is held", request_id="call-1")
+        await wait_until_settled(outbox)
+        assert not outbox.enqueue(app.url, "Order held", "Order 42 is held", request_id="call-1")
+        await asyncio.sleep(0.05)
+        assert len(app.requests) == 1
+        # A deliberate resend of the same email is a new request
+        assert outbox.enqueue(app.url, "Order held", "Order 42 is held")
+        assert await wait_until_settled(outbox) == {"pending": 0, "sent": 2, "failed": 0}
+        await outbox.stop()
+
+    run(scenario)
+    assert len(app.requests) == 2
+    assert app.requests[0][0] != app.requests[1][0]
+
+
+def test_digest_retry_keeps_its_emails_and_key(tmp_path, logic_app):
+    app = logic_app(statuses=[503], delay=0.05)
+
+    async def scenario():
+        outbox = EmailOutbox(str(tmp_path / "outbox.db"), digest_seconds=0.05)
+        outbox.enqueue(app.url, "First", "one")
+        outbox.enqueue(app.url, "Second", "two")
+        while not app.requests:
+            await asyncio.sleep(0.01)
+        # Queued while the digest is being delivered: goes out in a digest of its own
+        outbox.enqueue(app.url, "Third", "three")
+        assert await wait_until_settled(outbox) == {"pending": 0, "sent": 3, "failed": 0}
+        await outbox.stop()
+
+    run(scenario)
+    first_key, first = app.requests[0]
+    assert first["email_subject"] == "Digest: 2 messages"
+    deliveries = [(key, body) for key, body in app.requests if key == first_key]
+    assert deliveries == [(first_key, first)] * 2
+    third = [body for key, body in app.requests if key != first_key]
+    assert third == [{"email_subject": "Third", "email_body": "three"}]
+
+
+def test_outboxes_sharing_a_database_deliver_each_email_once(tmp_path, logic_app):
+    app = logic_app(delay=0.02)
+
+    async def scenario():
+        path = str(tmp_path / "outbox.db")
+        outboxes = [EmailOutbox(path, digest_seconds=0) for _ in range(3)]
+        for i in range(10):
+            outboxes[i % 3].enqueue(app.url, f"Order {i}", "held")
+        for outbox in outboxes:
+            outbox.start()
+        assert await wait_until_settled(outboxes[0]) == {"pending": 0, "sent": 10, "failed": 0}
+        for outbox in outboxes:
+            await outbox.stop()
+
+    run(scenario)
+    assert sorted(body["email_subject"] for _, body in app.requests) == [f"Order {i}" for i in range(10)]
+
+
+def test_claims_of_a_stopped_process_expire(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    crashed = EmailOutbox(path, digest_seconds=0, lease_seconds=0.05)
+    other = EmailOutbox(path, digest_seconds=0, lease_seconds=0.05)
+    now = time.time()
+    with crashed._lock:
+        crashed._db.execute(
+            "INSERT INTO emails (idempotency_key, endpoint, subject, body, created_at, next_attempt_at) "
+            "VALUES ('key', 'http://127.0.0.1:9/send', 'Order held', 'held', ?, ?)",
+            (now, now),
+        )
+        crashed._db.commit()
+    assert len(crashed._due_batches(now)) == 1
+    assert other._due_batches(now) == []
+    (batch,) = other._due_batches(now + 0.1)
+    assert batch[0]["claimed_by"] == other.owner
+    crashed._db.close()
+    other._db.close()
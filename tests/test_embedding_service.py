@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from api.plugins.embedding_service import EmbeddingService
+
+
+class FakeEmbeddings(EmbeddingService):
+    """Embedding service answering from the text length instead of calling Azure OpenAI."""
+
+    def __init__(self, fail: bool = False, delay: float = 0, **kwargs):
+        super().__init__(endpoint="http://embeddings.invalid", key="key", **kwargs)
+        self.fail = fail
+        self.delay = delay
+        self.batches = []
+        self.in_flight = self.max_in_flight = 0
+
+    async def _request(self, texts):
+        self.batches.append(list(texts))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("embeddings unavailable")
+            return [[float(len(text))] for text in texts]
+        finally:
+            self.in_flight -= 1
+
+
+def test_concurrent_calls_share_one_request():
+    async def scenario():
+        service = FakeEmbeddings(max_wait_ms=20)
+        vectors = await asyncio.gather(*(service.embed(text) for text in ["a", "bb", "a", "ccc"]))
+        assert vectors == [[1.0], [2.0], [1.0], [3.0]]
+        # Duplicate texts are sent once
+        assert service.batches == [["a", "bb", "ccc"]]
+
+    asyncio.run(scenario())
+
+
+def test_full_batch_is_sent_without_waiting():
+    async def scenario():
+        service = FakeEmbeddings(max_batch_size=2, max_wait_ms=10_000)
+        vectors = await asyncio.wait_for(asyncio.gather(service.embed("a"), service.embed("bb")), timeout=1)
+        assert vectors == [[1.0], [2.0]]
+        assert service.batches == [["a", "bb"]]
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_fails_every_caller():
+    async def scenario():
+        service = FakeEmbeddings(fail=True, max_wait_ms=1)
+        results = await asyncio.gather(service.embed("a"), service.embed("b"), return_exceptions=True)
+        assert [str(result) for result in results] == ["embeddings unavailable"] * 2
+
+        service.fail = False
+        assert await service.embed("a") == [1.0]
+
+    asyncio.run(scenario())
+
+
+def test_embed_many_keeps_order_and_bounds_concurrency():
+    async def scenario():
+        service = FakeEmbeddings(delay=0.01)
+        texts = ["x" * i for i in range(1, 11)]
+        vectors = await service.embed_many(texts, batch_size=3, concurrency=2)
+        assert vectors == [[float(i)] for i in range(1, 11)]
+        assert [len(batch) for batch in service.batches] == [3, 3, 3, 1]
+        assert service.max_in_flight == 2
+
+    asyncio.run(scenario())
+
+
+def test_request_errors_propagate_from_embed_many():
+    service = FakeEmbeddings(fail=True)
+    with pytest.raises(RuntimeError):
+        asyncio.run(service.embed_many(["a", "b"], batch_size=1))
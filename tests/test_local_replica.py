@@ -0,0 +1,154 @@
+import os
+import json
+import asyncio
+import threading
+
+import pytest
+
+from api.plugins import clients, local_replica
+from api.plugins.base_vector_search_plugin import search_cache
+from api.plugins.local_replica import LocalIndexReplica
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "search_index.json")
+
+
+def fixture_documents() -> list:
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+class FakeSearchClient:
+    """Answers `search(search_text="*")` with the given documents, like the async SearchClient."""
+
+    def __init__(self, documents: list):
+        self.documents = documents
+
+    async def search(self, search_text: str):
+        async def results():
+            for doc in self.documents:
+                yield {"@search.score": 1.0, **doc}
+        return results()
+
+
+def sync(replica, documents, embed_many=None) -> bool:
+    return asyncio.run(replica.sync(FakeSearchClient(documents), embed_many))
+
+
+def test_sync_builds_a_searchable_replica(tmp_path):
+    replica = LocalIndexReplica("accounts", str(tmp_path))
+    assert sync(replica, fixture_documents())
+    assert os.path.islink(tmp_path / "accounts")
+
+    hits = replica.search([0, 1, 0.1, 0], k=2)
+    assert [doc["account_name"] for doc, _ in hits] == ["Fabrikam", "Tailspin Toys"]
+    hits = replica.search([0, 1, 0.1, 0], k=5, filters={"nba_name": "Increase Credit Limit"})
+    assert [doc["account_name"] for doc, _ in hits] == ["Northwind"]
+    assert "text_vector" not in hits[0][0]
+
+    # A fresh process maps the same files
+    other = LocalIndexReplica("accounts", str(tmp_path))
+    assert other.load() and other.version == replica.version
+
+
+def test_unchanged_index_is_not_rebuilt(tmp_path):
+    replica = LocalIndexReplica("accounts", str(tmp_path))
+    sync(replica, fixture_documents())
+    before = sorted(os.listdir(tmp_path))
+    assert not sync(replica, fixture_documents())
+    # Another process that has not loaded it yet maps the published version instead of writing a new one
+    other = LocalIndexReplica("accounts", str(tmp_path))
+    assert sync(other, fixture_documents()) and other.version == replica.version
+    assert sorted(os.listdir(tmp_path)) == before
+
+
+def test_rebuild_keeps_the_old_mapping_readable(tmp_path):
+    replica = LocalIndexReplica("accounts", str(tmp_path))
+    sync(replica, fixture_documents())
+    old = LocalIndexReplica("accounts", str(tmp_path))
+    old.load()
+
+    changed = fixture_documents()
+    changed[0]["content"] = "Contoso released its credit holds."
+    assert sync(replica, changed)
+    assert replica.version != old.version
+    assert old.search([1, 0, 0, 0], k=1)[0][0]["content"] == "Contoso has two credit holds past release."
+    assert replica.search([1, 0, 0, 0], k=1)[0][0]["content"] == "Contoso released its credit holds."
+
+
+def test_concurrent_builds_never_expose_a_missing_replica(tmp_path):
+    LocalIndexReplica.build("accounts", fixture_documents(), str(tmp_path))
+    stop = threading.Event()
+    missing = []
+
+    def read():
+        while not stop.is_set():
+            if not LocalIndexReplica("accounts", str(tmp_path)).load():
+                missing.append(True)
+
+    def write(worker):
+        for i in range(10):
+            documents = fixture_documents()
+            documents[0]["content"] = f"version {worker}-{i}"
+            LocalIndexReplica.build("accounts", documents, str(tmp_path))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    writers = [threading.Thread(target=write, args=(worker,)) for worker in range(3)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    stop.set()
+    reader.join()
+
+    assert not missing
+    names = os.listdir(tmp_path)
+    assert not [name for name in names if ".tmp-" in name]
+    assert len([name for name in names if name.startswith(".accounts.v-")]) <= 2
+
+
+def test_documents_without_vectors_are_embedded_from_their_text(tmp_path):
+    documents = fixture_documents()
+    for doc in documents:
+        doc["text_vector"] = None
+    documents.append({"account_name": None, "content": None, "text_vector": None})
+    embedded = []
+
+    async def embed_many(texts):
+        embedded.extend(texts)
+        return [[1.0, i, 0, 0] for i in range(len(texts))]
+
+    replica = LocalIndexReplica("accounts", str(tmp_path))
+    assert sync(replica, documents, embed_many)
+    # The document with no text is left out instead of being embedded as ""
+    assert "" not in embedded and len(embedded) == 4
+    assert len(replica.documents) == 4
+
+
+def test_missing_vectors_need_an_embedder(tmp_path):
+    documents = fixture_documents()
+    documents[0]["text_vector"] = None
+    with pytest.raises(ValueError):
+        sync(LocalIndexReplica("accounts", str(tmp_path)), documents)
+
+
+def test_refreshing_a_replica_drops_its_cached_search_results(tmp_path, monkeypatch):
+    documents = fixture_documents()
+    monkeypatch.setattr(clients, "get_search_client", lambda index_name: FakeSearchClient(documents))
+    monkeypatch.setitem(local_replica._replicas, "accounts", LocalIndexReplica("accounts", str(tmp_path)))
+    accounts, other = ("accounts", "credit holds", 3, None, ()), ("products", "credit holds", 3, None, ())
+    search_cache.set(accounts, "Document: before the refresh")
+    search_cache.set(other, "Document: another index")
+
+    async def refresh_during_a_search():
+        async def search():
+            await local_replica.sync_replicas(["accounts"], embed_many=None)
+            return "Document: read from the old replica"
+        return await search_cache.get_or_load(("accounts", "in flight", 3, None, ()), search)
+
+    asyncio.run(refresh_during_a_search())
+    assert search_cache.get(accounts) is None
+    # A search that was running while the replica changed is not cached either
+    assert search_cache.get(("accounts", "in flight", 3, None, ())) is None
+    assert search_cache.get(other) == "Document: another index"
+    search_cache.clear()
@@ -0,0 +1,19 @@
+import pytest
+
+from api.plugins import registry
+
+
+def test_plugins_are_configured_by_default():
+    assert registry.missing_settings("ThresholdPlugin") == []
+    assert registry.missing_settings("EmailPlugin") == []
+
+
+def test_unset_settings_are_reported_by_environment_variable(monkeypatch):
+    spec = registry.PLUGIN_REGISTRY["ImproveOrderVelocityPlugin"]
+    monkeypatch.setitem(spec, "config", {"index_name": None})
+    assert registry.missing_settings("ImproveOrderVelocityPlugin") == ["IMPROVE_ORDER_VELOCITY_INDEX_NAME"]
+
+
+def test_unknown_plugin_is_a_key_error():
+    with pytest.raises(KeyError):
+        registry.get_plugin("NoSuchPlugin")
@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+from api.plugins.scheduler import (
+    BATCH,
+    INTERACTIVE,
+    AdaptiveConcurrency,
+    RateLimitScheduler,
+    TokenBucket,
+    parse_retry_after,
+    priority,
+)
+
+
+def response(status: int, headers: dict = None):
+    return SimpleNamespace(status_code=status, headers=headers or {})
+
+
+async def send_all(scheduler, responses: list, lane: int = INTERACTIVE):
+    sent = []
+
+    async def send():
+        sent.append(lane)
+        return responses.pop(0)
+
+    with priority(lane):
+        result = await scheduler.run(
+            send, status=lambda r: r.status_code, headers=lambda r: r.headers, discard=lambda r: asyncio.sleep(0),
+        )
+    return result, sent
+
+
+def test_parses_retry_after_headers():
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"retry-after": "2"}) == 2
+    assert parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_throttled_calls_are_retried_after_retry_after():
+    async def scenario():
+        scheduler = RateLimitScheduler("test", max_attempts=3)
+        result, sent = await send_all(scheduler, [response(429, {"retry-after-ms": "10"}), response(503), response(200)])
+        assert result.status_code == 200 and len(sent) == 3
+        assert scheduler.stats()["throttled"] == 1 and scheduler.stats()["retries"] == 2
+        # Throttling halves the concurrency limit
+        assert scheduler.concurrency.limit < scheduler.concurrency.maximum
+
+        # When every attempt is throttled the last response is returned
+        result, _ = await send_all(scheduler, [response(429, {"retry-after-ms": "1"})] * 3)
+        assert result.status_code == 429
+
+    asyncio.run(scenario())
+
+
+def test_bucket_serves_interactive_waiters_before_batch_ones():
+    async def scenario():
+        bucket = TokenBucket(per_minute=600)
+        await bucket.acquire(600)
+        order = []
+
+        async def take(name, lane):
+            await bucket.acquire(1, lane)
+            order.append(name)
+
+        batch = [asyncio.create_task(take(f"batch{i}", BATCH)) for i in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(take("interactive", INTERACTIVE))
+        await asyncio.gather(*batch, interactive)
+        assert order == ["interactive", "batch0", "batch1"]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_bucket_waiter_does_not_block_the_others():
+    async def scenario():
+        bucket = TokenBucket(per_minute=600)
+        await bucket.acquire(600)
+        first = asyncio.create_task(bucket.acquire(1))
+        second = asyncio.create_task(bucket.acquire(1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        assert bucket._waiters == []
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_calls_do_not_hold_a_concurrency_slot():
+    async def scenario():
+        scheduler = RateLimitScheduler("test", rpm=600, max_concurrency=1)
+        await scheduler.requests.acquire(600)
+        batch = asyncio.create_task(send_all(scheduler, [response(200)], BATCH))
+        await asyncio.sleep(0.01)
+        # The batch call waits for the rate limit without taking the only slot
+        assert scheduler.concurrency.in_flight == 0
+        interactive = asyncio.create_task(send_all(scheduler, [response(200)], INTERACTIVE))
+        (_, batch_sent), (_, interactive_sent) = await asyncio.gather(batch, interactive)
+        assert scheduler.sent == 2 and batch_sent == [BATCH] and interactive_sent == [INTERACTIVE]
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_admits_lower_lanes_first():
+    async def scenario():
+        concurrency = AdaptiveConcurrency(maximum=1, minimum=1)
+        await concurrency.acquire()
+        order = []
+
+        async def take(name, lane):
+            await concurrency.acquire(lane)
+            order.append(name)
+            concurrency.release()
+
+        tasks = [asyncio.create_task(take("batch", BATCH))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(take("interactive", INTERACTIVE)))
+        await asyncio.sleep(0)
+        concurrency.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "batch"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,29 @@
+import pytest
+
+from api.plugins.base_vector_search_plugin import build_odata_filter
+
+
+def test_builds_equality_list_and_range_clauses():
+    odata = build_odata_filter({"account_name": "O'Brien", "nba_name": ["A", "B"], "amount": {"ge": 10, "lt": 20}})
+    assert odata == ("account_name eq 'O''Brien' and search.in(nba_name, 'A|B', '|') "
+                     "and amount ge 10 and amount lt 20")
+
+
+def test_list_values_pick_a_delimiter_they_do_not_contain():
+    assert build_odata_filter({"nba_name": ["a|b", "c"]}) == "search.in(nba_name, 'a|b,c', ',')"
+
+
+def test_numeric_and_boolean_lists_are_or_ed_equalities():
+    assert build_odata_filter({"score": [1, 2.5], "active": [True]}) == (
+        "(score eq 1 or score eq 2.5) and (active eq true)"
+    )
+
+
+@pytest.mark.parametrize("filters", [
+    {"account name": "Contoso"},
+    {"amount": {"between": [1, 2]}},
+    {"nba_name": ["a|b", "c,d", "e;f", "g~h"]},
+])
+def test_invalid_filters_raise_value_error(filters):
+    with pytest.raises(ValueError):
+        build_odata_filter(filters)
@@ -0,0 +1,63 @@
+import time
+import asyncio
+
+from api.semantic_cache import SemanticCache
+
+VECTORS = {
+    "which accounts have credit holds?": [1.0, 0.0, 0.0],
+    "what accounts have credit holds?": [0.99, 0.1, 0.0],
+    "who owns contoso?": [0.0, 1.0, 0.0],
+}
+
+
+class FakeEmbed:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, text):
+        self.calls.append(text)
+        return VECTORS[text.casefold()]
+
+
+def test_similar_questions_reuse_an_answer():
+    async def scenario():
+        embed = FakeEmbed()
+        cache = SemanticCache(embed, threshold=0.95, ttl=60)
+        answer, ticket = await cache.lookup("Which accounts have credit holds?")
+        assert answer is None
+        cache.store(ticket, {"answer": "Contoso"})
+
+        # Same text up to case and whitespace: no embeddings call
+        assert (await cache.lookup("  which accounts   have credit holds? "))[0] == {"answer": "Contoso"}
+        assert (await cache.lookup("What accounts have credit holds?"))[0] == {"answer": "Contoso"}
+        assert (await cache.lookup("Who owns Contoso?"))[0] is None
+        assert len(embed.calls) == 3
+        assert cache.stats() == {"size": 1, "hits": 2, "misses": 2}
+
+    asyncio.run(scenario())
+
+
+def test_answers_expire():
+    async def scenario():
+        cache = SemanticCache(FakeEmbed(), ttl=0.05)
+        _, ticket = await cache.lookup("Who owns Contoso?")
+        cache.store(ticket, "Alex")
+        time.sleep(0.1)
+        assert (await cache.lookup("Who owns Contoso?"))[0] is None
+
+    asyncio.run(scenario())
+
+
+def test_clear_drops_answers_and_refuses_answers_computed_before_it():
+    async def scenario():
+        cache = SemanticCache(FakeEmbed(), ttl=60)
+        _, stored = await cache.lookup("Who owns Contoso?")
+        cache.store(stored, "Alex")
+        _, in_flight = await cache.lookup("Which accounts have credit holds?")
+        # An index refresh passes the index name
+        cache.clear("account-owner")
+        cache.store(in_flight, "Contoso")
+        assert len(cache) == 0
+        assert (await cache.lookup("Who owns Contoso?"))[0] is None
+
+    asyncio.run(scenario())
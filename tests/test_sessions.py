@@ -0,0 +1,80 @@
+import asyncio
+
+from api.sessions import ChatSession, SessionStore
+
+
+def record(store, session, turns):
+    async def run():
+        for question, answer in turns:
+            await store.record(session, question, answer)
+    asyncio.run(run())
+
+
+def test_old_turns_are_folded_into_the_summary():
+    calls = []
+
+    async def summarize(summary, turns):
+        calls.append(turns)
+        return f"{len(turns)} turns"
+
+    store = SessionStore(summarize=summarize, token_budget=100)
+    session = store.get("u")
+    record(store, session, [(f"question {i} " * 5, f"answer {i} " * 5) for i in range(6)])
+    assert calls and session.summary.endswith("turns")
+    assert session.history_tokens() <= store.token_budget
+
+
+def test_turns_are_kept_when_summarizing_fails():
+    async def summarize(summary, turns):
+        raise RuntimeError("model unavailable")
+
+    store = SessionStore(summarize=summarize, token_budget=100)
+    session = store.get("u")
+    record(store, session, [("question " * 10, "answer " * 10)] * 3)
+    assert len(session.turns) == 3 and session.summary == ""
+
+    # Past twice the budget the oldest turns go anyway, so a session cannot grow without bound
+    record(store, session, [("question " * 10, "answer " * 10)] * 5)
+    assert len(session.turns) < 8
+    assert session.history_tokens() <= store.token_budget * 2
+
+
+def test_summary_is_cut_to_half_the_budget_keeping_its_start():
+    async def summarize(summary, turns):
+        return "Earliest facts first. " + "detail " * 500
+
+    store = SessionStore(summarize=summarize, token_budget=100)
+    session = store.get("u")
+    record(store, session, [("question " * 10, "answer " * 10)] * 3)
+    assert session.summary.startswith("Earliest facts first.")
+    assert session.summary.endswith("[truncated]")
+    assert session.history_tokens() <= store.token_budget + 5
+
+
+def test_sessions_in_use_are_not_evicted():
+    async def scenario():
+        store = SessionStore(max_sessions=2)
+        busy = store.get("busy")
+        async with busy.lock:
+            store.get("idle")
+            store.get("new")
+            assert store.get("busy") is busy
+            assert len(store) == 2
+            # With every other session in use the store goes over its bound rather than drop one
+            async with store.get("new").lock:
+                store.get("newest")
+                assert len(store) == 3
+                assert store.get("busy") is busy
+
+    asyncio.run(scenario())
+
+
+def test_successive_tasks_extend_the_same_prefix():
+    session = ChatSession("u")
+    session.turns = [("Which accounts have holds?", "Contoso and Fabrikam.")]
+    second = session.build_task("Who owns Contoso?")
+    session.turns.append(("Who owns Contoso?", "Alex."))
+    third = session.build_task("Email Alex about it.")
+    history = second[:second.index("\n\nCurrent question:")]
+    assert third.startswith(history)
+    assert third.endswith("Current question:\nEmail Alex about it.")
@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+from api.sk_agent import DOMAIN_AGENT_INSTRUCTIONS, DOMAIN_AGENTS, SemanticKernelAgent
+
+
+class FakeAgent:
+    """Domain agent stand-in that records how many agents are running at once."""
+
+    running = 0
+    peak = 0
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def get_response(self, messages):
+        FakeAgent.running += 1
+        FakeAgent.peak = max(FakeAgent.peak, FakeAgent.running)
+        await asyncio.sleep(0.02)
+        FakeAgent.running -= 1
+        return SimpleNamespace(message=SimpleNamespace(content=f"{self.name} on {messages}"))
+
+
+def test_agent_limit_is_shared_by_concurrent_chats():
+    async def scenario():
+        agent = SemanticKernelAgent()
+        agent.agent_slots = asyncio.Semaphore(3)
+        agent.domain_agents = [FakeAgent(f"Agent{i}") for i in range(5)]
+        results = await asyncio.gather(*(agent.gather_findings(f"question {n}") for n in range(4)))
+        assert [name for name, _ in results[0]] == [f"Agent{i}" for i in range(5)]
+        assert results[3][0] == ("Agent0", "Agent0 on question 3")
+
+    asyncio.run(scenario())
+    assert FakeAgent.peak == 3
+
+
+def test_domain_agent_prompts_share_everything_but_their_last_line():
+    prompts = [DOMAIN_AGENT_INSTRUCTIONS.format(focus=focus) for _, _, focus in DOMAIN_AGENTS]
+    shared = DOMAIN_AGENT_INSTRUCTIONS[:DOMAIN_AGENT_INSTRUCTIONS.rindex("\n") + 1]
+    assert all(prompt.startswith(shared) for prompt in prompts)
+    assert "{focus}" not in shared
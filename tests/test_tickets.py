@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from api import tickets
+from api.db import ConnectionPool, init_sqlite_tickets
+from api.tickets import decode_cursor, encode_cursor, fetch_ticket_changes, fetch_tickets_page, stream_tickets
+
+
+@pytest.mark.parametrize("creation_date, ticket_number", [
+    (datetime(2024, 5, 1, 12, 30, 15), 42),
+    (date(2024, 5, 1), 42),
+    (datetime(2024, 5, 1, 12, 30), Decimal("1000000000000000000001")),
+    ("2024-05-01", "T-42"),
+])
+def test_cursor_round_trips_column_types(creation_date, ticket_number):
+    decoded = decode_cursor(encode_cursor({"creation_date": creation_date, "ticket_number": ticket_number}))
+    assert decoded == [creation_date, ticket_number]
+    assert [type(value) for value in decoded] == [type(creation_date), type(ticket_number)]
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor({"creation_date": 1, "ticket_number": 2})[:-4],
+                                    "W3siZGVjIjogIngifSwgMV0="])
+def test_malformed_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = tmp_path / "tickets.db"
+    with sqlite3.connect(path) as conn:
+        init_sqlite_tickets(conn, 50)
+    pool = ConnectionPool(connect=lambda: sqlite3.connect(path, check_same_thread=False), size=2, timeout=1)
+    yield pool
+    pool.close()
+
+
+def test_pages_reach_tickets_without_a_creation_date(pool):
+    with pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO voice_tickets (ticket_number, creation_date) VALUES (?, NULL)",
+            [("TCK9000001",), ("TCK9000002",), ("TCK9000003",)],
+        )
+        conn.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(pool.run(fetch_tickets_page, ["ticket_number", "creation_date"], 7, cursor))
+        seen += page["items"]
+        if page["next_cursor"] is None:
+            break
+        cursor = decode_cursor(page["next_cursor"])
+    assert len(seen) == 53
+    assert len({item["ticket_number"] for item in seen}) == 53
+    # Undated tickets come last, newest ticket number first
+    assert [item["ticket_number"] for item in seen[-3:]] == ["TCK9000003", "TCK9000002", "TCK9000001"]
+
+
+def test_exports_leave_a_connection_for_paginated_requests(pool):
+    async def scenario():
+        first = stream_tickets(pool, ["ticket_number"], batch_size=10)
+        second = stream_tickets(pool, ["ticket_number"], batch_size=10)
+        assert (await first.__anext__()).startswith(b'{"ticket_number"')
+        # A pool of 2 has one export slot: the second export waits for it...
+        waiting = asyncio.ensure_future(second.__anext__())
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        # ...while paginated requests still get a connection
+        page = await pool.run(fetch_tickets_page, ["ticket_number"], 5)
+        assert len(page["items"]) == 5
+        # Once the first export is closed, its connection goes back and the second one runs
+        await first.aclose()
+        assert (await waiting).startswith(b'{"ticket_number"')
+        assert len([chunk async for chunk in second]) == 4
+        assert pool._idle.qsize() == pool._opened
+
+    asyncio.run(scenario())
+
+
+def test_exports_are_refused_by_a_single_connection_pool(tmp_path):
+    pool = ConnectionPool(connect=lambda: sqlite3.connect(tmp_path / "tickets.db", check_same_thread=False), size=1)
+    try:
+        with pytest.raises(RuntimeError):
+            asyncio.run(stream_tickets(pool, ["ticket_number"]).__anext__())
+        assert pool._opened == 0
+    finally:
+        pool.close()
+
+
+def test_changes_feed_pages_inserts_and_updates(pool):
+    def changes(since, limit):
+        return asyncio.run(pool.run(fetch_ticket_changes, ["ticket_number", "current_Status"], since, limit))
+
+    first = changes(0, 30)
+    assert [item["ticket_number"] for item in first["items"]] == [f"TCK{i:07d}" for i in range(30)]
+    assert first["has_more"]
+    second = changes(first["watermark"], 30)
+    assert len(second["items"]) == 20 and not second["has_more"]
+    assert changes(second["watermark"], 30) == {"items": [], "watermark": second["watermark"], "has_more": False}
+
+    with pool.connection() as conn:
+        conn.execute("UPDATE voice_tickets SET current_Status = 'Closed' WHERE ticket_number = 'TCK0000003'")
+        init_sqlite_tickets(conn, 1)
+        conn.commit()
+    third = changes(second["watermark"], 30)
+    assert third["items"] == [{"ticket_number": "TCK0000003", "current_Status": "Closed"},
+                              {"ticket_number": "TCK0000050", "current_Status": "Resolved"}]
+    assert third["watermark"] > second["watermark"]
+
+
+class _FakeCursor:
+    """SQL Server cursor stand-in: MIN_ACTIVE_ROWVERSION() is 10 and two changed rows lie below it."""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return (10,)
+
+    def fetchmany(self, size):
+        return [("T1", 4), ("T2", 7)][:size]
+
+
+def test_sql_server_changes_stop_at_the_oldest_active_transaction(monkeypatch):
+    monkeypatch.setattr(tickets, "DB_SQLITE_PATH", None)
+    cursor = _FakeCursor()
+    conn = type("Conn", (), {"cursor": lambda self: cursor})()
+
+    result = fetch_ticket_changes(conn, ["ticket_number"], 2, 5)
+    sql, params = cursor.executed[-1]
+    assert "< CAST(CAST(? AS BIGINT) AS BINARY(8))" in sql
+    assert params == [6, 2, 10]
+    # Nothing below the horizon is left, so the next sync starts right below it
+    assert result == {"items": [{"ticket_number": "T1"}, {"ticket_number": "T2"}], "watermark": 9, "has_more": False}
+
+    # With more rows waiting the watermark is the last row returned
+    assert fetch_ticket_changes(conn, ["ticket_number"], 2, 1)["watermark"] == 4
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    from api import db
+    from api.main import app
+
+    if os.path.exists(db.DB_SQLITE_PATH):
+        os.remove(db.DB_SQLITE_PATH)
+    with sqlite3.connect(db.DB_SQLITE_PATH) as conn:
+        init_sqlite_tickets(conn, 20)
+    with TestClient(app) as client:
+        yield client
+
+
+def _set_status(ticket_number: str, status: str):
+    from api import db
+
+    with sqlite3.connect(db.DB_SQLITE_PATH) as conn:
+        conn.execute("UPDATE voice_tickets SET current_Status = ? WHERE ticket_number = ?", (status, ticket_number))
+
+
+@pytest.mark.parametrize("version_column", ["row_version", None])
+def test_etag_changes_when_a_ticket_is_updated(client, version_column):
+    client.app.state.tickets_cache = tickets.TicketsCache(signal_ttl=0.01, version_column=version_column)
+    url = "/api/tickets?limit=5&fields=ticket_number,current_Status"
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    _set_status(first.json()["items"][0]["ticket_number"], "Escalated")
+    time.sleep(0.02)
+    second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["ETag"] != etag
+    assert second.json()["items"][0]["current_Status"] == "Escalated"
+    assert client.get(url, headers={"If-None-Match": second.headers["ETag"]}).status_code == 304
+
+
+def test_cached_pages_are_served_without_a_query(client, monkeypatch):
+    client.app.state.tickets_cache = tickets.TicketsCache(signal_ttl=60, version_column="row_version")
+    queries = []
+    pool = client.app.state.db_pool
+    run = pool.run
+
+    async def counting_run(fn, *args, **kwargs):
+        queries.append(fn.__name__)
+        return await run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(pool, "run", counting_run)
+    first = client.get("/api/tickets?limit=5")
+    second = client.get("/api/tickets?limit=5")
+    assert second.content == first.content and second.headers["ETag"] == first.headers["ETag"]
+    assert queries == ["fetch_change_signal", "fetch_tickets_page"]
+    # Conditional requests are answered from the cached change signal as well
+    assert client.get("/api/tickets?limit=5", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert len(queries) == 2
+
+
+def test_export_is_refused_without_a_spare_connection(client):
+    pool, client.app.state.db_pool = client.app.state.db_pool, ConnectionPool(size=1)
+    try:
+        assert client.get("/api/tickets/export").status_code == 503
+    finally:
+        client.app.state.db_pool.close()
+        client.app.state.db_pool = pool